@@ -22,15 +22,18 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pylab import *
+from numpy import *
 
 from AIGO import logger, logFun
 
-from AIGO.Similarity import GOSet_Similarity, GO_Similarity
+from AIGO.AnnotationStore import setSizes
+from AIGO.Statistics import registerStat as rS
+from AIGO.Similarity import GOSet_Similarity, GOSet_BatchSimilarity, GO_Similarity, GO_SampledSimilarity
 
 class AnalyseFA(dict):
     """
     This class provides methods to compute statistis about functional annotations.
+    The statistics registered as per aspect take aspects, the GO aspects to compute (all by default).
     """
 
     def __init__(self, **args):
@@ -70,32 +73,27 @@ class AnalyseFA(dict):
         for FA in allFA:
             logger.info("\t%s" % FA.name)
 
-            #Compute the percentage of obsolete annotations
             allObsAnnot=dict()
-
-            obs=sum([len(FA.GOtoGP[a][goid]) for a in FA.G.aspect for goid in FA.GOtoGP[a] if FA.G.isObsolete(goid)])
-            total=sum([len(FA.GOtoGP[a][goid]) for a in FA.G.aspect for goid in FA.GOtoGP[a] ])
-            allObsAnnot['All_aspects_of_GO'] = 100.* obs / total
+            allObsTerm=dict()
+            obsAnnot, totalAnnot, obsTerm, totalTerm = 0, 0, 0, 0
 
             for a in FA.G.aspect:
-                obs=sum([len(FA.GOtoGP[a][goid]) for goid in FA.GOtoGP[a] if FA.G.isObsolete(goid)])
-                total=sum([len(FA.GOtoGP[a][goid]) for goid in FA.GOtoGP[a] ])
-                allObsAnnot[a]=100.* obs / total
-
-            FA['obsolete']=allObsAnnot
-
-            #Compute the percentage of obsolete GO terms
-            allObsTerm=dict()
+                terms, counts, ancestors, obsolete, unconnected = FA.termTable(a)
 
-            obs=sum([1 for a in FA.G.aspect for goid in FA.GOtoGP[a] if FA.G.isObsolete(goid)])
-            total=sum([1 for a in FA.G.aspect for goid in FA.GOtoGP[a] ])
-            allObsTerm['All_aspects_of_GO']  = 100.* obs / total
+                #Compute the percentage of obsolete annotations
+                obs, total = int(counts[obsolete].sum()), int(counts.sum())
+                allObsAnnot[a]=100.* obs / total
+                obsAnnot, totalAnnot = obsAnnot + obs, totalAnnot + total
 
-            for a in FA.G.aspect:
-                obs=sum([1 for goid in FA.GOtoGP[a] if FA.G.isObsolete(goid)])
-                total=sum([1 for goid in FA.GOtoGP[a] ])
+                #Compute the percentage of obsolete GO terms
+                obs, total = int(obsolete.sum()), len(terms)
                 allObsTerm[a]= 100. * obs / total
+                obsTerm, totalTerm = obsTerm + obs, totalTerm + total
+
+            allObsAnnot['All_aspects_of_GO'] = 100.* obsAnnot / totalAnnot
+            allObsTerm['All_aspects_of_GO']  = 100.* obsTerm / totalTerm
 
+            FA['obsolete']=allObsAnnot
             FA['obsTerm']=allObsTerm
 
     @logFun("Computing Obsolescence")
@@ -108,19 +106,18 @@ class AnalyseFA(dict):
         for FA in allFA:
             logger.info("\t%s" % FA.name)
 
-            #Compute the percentage of obsolete annotations
+            #Compute the percentage of unconnected annotations
             allUnconnected=dict()
-
-            unconnected=sum(
-                    [len(FA.GOtoGP[a][goid]) for a in FA.G.aspect for goid in FA.GOtoGP[a] if FA.G.isUnconnected(goid)]
-                    )
-            total=sum([len(FA.GOtoGP[a][goid]) for a in FA.G.aspect for goid in FA.GOtoGP[a] ])
-            allUnconnected['All_aspects_of_GO'] = 100.* unconnected / total
+            allUnconnectedAnnot, allAnnot = 0, 0
 
             for a in FA.G.aspect:
-                unconnected=sum([len(FA.GOtoGP[a][goid]) for goid in FA.GOtoGP[a] if FA.G.isUnconnected(goid)])
-                total=sum([len(FA.GOtoGP[a][goid]) for goid in FA.GOtoGP[a] ])
-                allUnconnected[a]=100.* unconnected / total
+                terms, counts, ancestors, obsolete, unconnected = FA.termTable(a)
+
+                nbUnconnected, total = int(counts[unconnected].sum()), int(counts.sum())
+                allUnconnected[a]=100.* nbUnconnected / total
+                allUnconnectedAnnot, allAnnot = allUnconnectedAnnot + nbUnconnected, allAnnot + total
+
+            allUnconnected['All_aspects_of_GO'] = 100.* allUnconnectedAnnot / allAnnot
 
             FA['unconnected']=allUnconnected
 
@@ -132,7 +129,9 @@ class AnalyseFA(dict):
 
         for FA in allFA:
             logger.info("\t%s" % FA.name)
+            FA.expand()
 
+            removed, genes = list(), list()
             for a in FA.G.aspect:
                 lgoid=FA.GOtoGP[a].keys()
                 for goid in lgoid:
@@ -140,14 +139,18 @@ class AnalyseFA(dict):
 
                 lgp=FA.GPtoGO[a].keys()
                 for g in lgp:
+                    removed.extend([(g, goid, a) for goid in FA.GPtoGO[a][g] if FA.G.isUnconnected(goid)])
                     FA.GPtoGO[a][g]  = set(filter (lambda(goid): not FA.G.isUnconnected(goid), FA.GPtoGO[a][g]))
 
-                    if len(FA.GPtoGO[a][g])==0: del FA.GPtoGO[a][g]
+                    if len(FA.GPtoGO[a][g])==0:
+                        del FA.GPtoGO[a][g]
+                        genes.append(g)
 
-            #Find the set of annotated gene products
-            FA['GA']=set()
-            for a in  FA.G.aspect:
-                FA['GA']=FA['GA']  | set(FA.GPtoGO[a].keys())
+            if FA.isColumnar():
+                FA.compact()
+
+            #Update the set of annotated gene products and the statistics
+            FA.changed([], removed, genes, FA.G.aspect)
 
     @logFun("Removing redundancy")
     def removeRedundancy(self, allFA):
@@ -157,18 +160,28 @@ class AnalyseFA(dict):
 
         for FA in allFA:
             logger.info("\t%s" % FA.name)
+            allRedundant=dict([(a, FA.redundant(a)) for a in FA.G.aspect])
+            FA.expand()
+
+            removed=list()
             for a in FA.G.aspect:
                 for g in FA.GPtoGO[a].keys():
                 	
-                    redundant=FA.G.get_Redundant(FA.GPtoGO[a][g])
+                    redundant=allRedundant[a].get(g, ())
                     FA.GPtoGO[a][g] = FA.GPtoGO[a][g].difference(redundant)
 
                     for goid in redundant:
                         FA.GOtoGP[a][goid].remove(g)
                         if len(FA.GOtoGP[a][goid])==0: del FA.GOtoGP[a][goid]
+                        removed.append((g, goid, a))
+
+            if FA.isColumnar():
+                FA.compact()
+
+            FA.changed([], removed)
 
     @logFun("Computing redundancy")
-    def redundancy(self, allFA):
+    def redundancy(self, allFA, aspects=None):
         """
         This method computes the percentage of redundant annotations.
         """
@@ -178,16 +191,16 @@ class AnalyseFA(dict):
 
             allRedundancy=dict()
             #for each aspect of go
-            for a in FA.G.aspect:
+            for a in aspects or FA.G.aspect:
                 nbAnnot = sum([ len(FA.GPtoGO[a][g]) for g in FA.GPtoGO[a]])
                 nbRed= 0
             	#for each gene in the annotations for that aspect
-                for g in FA.GPtoGO[a]:
-                    nbRed = nbRed + len(FA.G.get_Redundant(FA.GPtoGO[a][g]))
+                for redundant in FA.redundant(a).itervalues():
+                    nbRed = nbRed + len(redundant)
 
                 allRedundancy[a]= (100.0 * nbRed / nbAnnot )
 
-            allRedundancy['All_aspects_of_GO'] = mean([allRedundancy[a] for a in FA.G.aspect])
+            allRedundancy['All_aspects_of_GO'] = mean([allRedundancy[a] for a in aspects or FA.G.aspect])
             FA['redundancy']=allRedundancy
 
 
@@ -216,22 +229,7 @@ class AnalyseFA(dict):
 
         for FA in allFA:
             logger.info("\t%s" % FA.name)
-
-            At=set()
-            GO=set()
-            for a in FA.G.aspect:
-                At= At | set(FA.GOtoGP[a])
-                GO= GO | set([FA.G.GOAlt.get(t,t) for t in FA.G.N if FA.G.GONameSpace[t] == a])
-            richness=100.* len(At)/len(GO)
-
-            allRichness=dict()
-            for a in FA.G.aspect:
-                At=set(FA.GOtoGP[a])
-                GO=set([FA.G.GOAlt.get(t,t) for t in FA.G.N if FA.G.GONameSpace[t] == a])
-                allRichness[a]=100.0*len(At)/len(GO)
-
-            allRichness['All_aspects_of_GO'] =richness
-            FA['richness']=allRichness
+            FA['richness']=_richness(FA)
 
 
     @logFun("Computing the number of annotations per set")
@@ -243,17 +241,17 @@ class AnalyseFA(dict):
         for FA in allFA:
             logger.info("\t%s" % FA.name)
 
-            numberAnnot=mean([ len(FA.GPtoGO[a][g]) for a in FA.GPtoGO for g in FA.GPtoGO[a]])
+            numberAnnot=mean([ n for a in FA.GPtoGO for n in setSizes(FA.GPtoGO[a])])
             allNumberAnnot=dict()
             for a in FA.G.aspect:
-                allNumberAnnot[a]= [ len(FA.GPtoGO[a][g]) for g in FA.GPtoGO[a]]
+                allNumberAnnot[a]= setSizes(FA.GPtoGO[a])
 
             allNumberAnnot['All_aspects_of_GO'] = numberAnnot
             FA['numberAnnot'] = allNumberAnnot
 
 
     @logFun("Computing the functional coherence")
-    def coherence(self, allFA):
+    def coherence(self, allFA, aspects=None):
         """
         This method computes the semantic similarity between the annotations of each gene product.
         """
@@ -262,33 +260,46 @@ class AnalyseFA(dict):
             logger.info("\t%s" % FA.name)
 
             allCoherence=dict()
-            for a in FA.G.aspect:
-                allCoherence[a]= [GOSet_Similarity(FA.G, FA.GPtoGO[a][g])[0] for g in FA.GPtoGO[a] ]
+            for a in aspects or FA.G.aspect:
+                genes, offsets, allD = GOSet_BatchSimilarity(FA.G, FA.GPtoGO[a])
+                allCoherence[a]= allD[offsets[:-1]].tolist()
 
-            allCoherence['All_aspects_of_GO'] = mean([mean(allCoherence[a]) for a in FA.G.aspect])
+            allCoherence['All_aspects_of_GO'] = mean([mean(allCoherence[a]) for a in aspects or FA.G.aspect])
             FA['coherence']= allCoherence
 
 
     @logFun("Computing the compactness")
-    def compactness(self, allFA):
+    def compactness(self, allFA, metric="GS2", error=None, confidence=0.95, aspects=None, **kargs):
         """
         This method computes the semantic similarity between the gene products.
+        If error is given, the similarity is estimated from a sample of the pairs of gene products
+        (see GO_SampledSimilarity) and its confidence interval is stored in FA['compactnessCI'].
         """
 
         for FA in allFA:
             logger.info("\t%s" % FA.name)
 
             allCompactness=dict()
-            for a in FA.G.aspect:
-                sim, l = GO_Similarity(FA.G, FA.GPtoGO[a].values())
+            allCI=dict()
+            for a in aspects or FA.G.aspect:
+                if metric=="GS2":
+                    kargs['inducedCounts']=FA.inducedCounts(a)
+
+                if error is None:
+                    sim, l = GO_Similarity(FA.G, FA.GPtoGO[a].values(), metric, **kargs)
+                else:
+                    sim, l, allCI[a] = GO_SampledSimilarity(FA.G, FA.GPtoGO[a].values(), metric, error, confidence, **kargs)
+                    logger.info("\t\t%s : %.4f (%.4f-%.4f)" % (a, sim, allCI[a][0], allCI[a][1]))
                 allCompactness[a]=l
 
-            allCompactness['All_aspects_of_GO'] = mean([mean(allCompactness[a]) for a in FA.G.aspect])
+            allCompactness['All_aspects_of_GO'] = mean([mean(allCompactness[a]) for a in aspects or FA.G.aspect])
             FA['compactness']=allCompactness
+            if error is not None:
+                FA['compactnessCI']=allCI
 
 
     @logFun("Computing the specificity")
-    def specificity(self, allFA):
+    def specificity(self, allFA, aspects=None):
         """
         This method computes mean number of ancestor annotations per annotated gene product.
         """
@@ -299,20 +310,15 @@ class AnalyseFA(dict):
 
             allSpecificity=dict()
             #for each aspect
-            for a in FA.G.aspect:
-            	#get go terms for all genes annotated in that aspect not unique, but every annotation
-                allGO=[FA.G.GOtoInt(FA.GPtoGO[a][g]) for g in FA.GPtoGO[a]]
-                #get the number of ancestors for each go term in the previous step.
-                #if a term is annotated to n number of genes it will be repeated n number of times
-                #mean of number of ancestors for each annotated term is calculated as specificity for each aspect
-                allSpecificity[a] = [ mean([len(FA.G.ancestors(gsid)) for gsid in GO ]) for GO in allGO ]
-
-            allSpecificity['All_aspects_of_GO'] = mean([mean(allSpecificity[a]) for a in FA.G.aspect])
+            for a in aspects or FA.G.aspect:
+                allSpecificity[a] = _specificity(FA, a)
+
+            allSpecificity['All_aspects_of_GO'] = mean([mean(allSpecificity[a]) for a in aspects or FA.G.aspect])
             FA['specificity']=allSpecificity
 
 
     @logFun("Computing the information content")
-    def informationContent(self, allFA):
+    def informationContent(self, allFA, aspects=None):
         """
         This method computes the infotrmation content.
         """
@@ -320,27 +326,129 @@ class AnalyseFA(dict):
         for FA in allFA:
             logger.info("\t%s" % FA.name)
 
-            IC=dict()
-            for a in FA.G.aspect:
-                IC[a]=dict()
-                for go in FA.GOtoGP[a]:
-                    n=len(FA.GOtoGP[a][go])
-                    for ans in FA.G.InttoGO(FA.G.ancestors(FA.G.get_intid(go))):
-                        IC[a][ans]=IC[a].get(ans, 0) + n
-
-            for a in FA.G.aspect:
-                if len(IC[a].values())==0:
-                    continue
-                m=max(IC[a].values())
-                for go in IC[a]:
-                    IC[a][go]=-1. * log(1.*IC[a][go]/m)
+            IC=FA.IC()
 
             allInformationContent=dict()
-            for a in FA.G.aspect:
-                allInformationContent[a]=[mean([IC[a][go] for go in FA.GPtoGO[a][g] ]) for g in FA.GPtoGO[a] ]
+            for a in aspects or FA.G.aspect:
+                allInformationContent[a]=IC.means(FA.GPtoGO[a].itervalues())
 
-            allInformationContent['All_aspects_of_GO'] = mean([mean(allInformationContent[a]) for a in FA.G.aspect])
+            allInformationContent['All_aspects_of_GO'] = mean([mean(allInformationContent[a]) for a in aspects or FA.G.aspect])
             FA['informationContent']=allInformationContent
 
 
+def _richness(FA):
+    """
+    Return the richness of each aspect: the percentage of the GO terms of the aspect that are annotated
+    """
+    At=set()
+    for a in FA.G.aspect:
+        At= At | set(FA.GOtoGP[a])
+    GO=unique(concatenate([FA.G.get_AspectTerms(a) for a in FA.G.aspect]))
+    richness=100.* len(At)/len(GO)
+
+    allRichness=dict()
+    for a in FA.G.aspect:
+        allRichness[a]=100.0*len(FA.GOtoGP[a])/FA.G.get_AspectSize(a)
+
+    allRichness['All_aspects_of_GO'] =richness
+    return allRichness
+
+def _specificity(FA, a):
+    """
+    Return the mean number of ancestors of the annotations of each gene product of an aspect
+    """
+    #get go terms for all genes annotated in that aspect not unique, but every annotation
+    allGO=[FA.GPtoGO[a][g] for g in FA.GPtoGO[a]]
+    #get the number of ancestors for each go term in the previous step.
+    #if a term is annotated to n number of genes it will be repeated n number of times
+    #mean of number of ancestors for each annotated term is calculated as specificity for each aspect
+    terms, counts, ancestors, obsolete, unconnected = FA.termTable(a)
+    nbAncestors=dict(zip(terms, ancestors.tolist()))
+    return [ mean([nbAncestors[goid] for goid in GO ]) for GO in allGO ]
+
+def _annotationCounts(FA, a):
+    """
+    Return the number of annotations and of GO terms of an aspect, then the number of obsolete annotations,
+    obsolete terms and unconnected annotations, cached per aspect by FuncAnnot
+    """
+    def compute():
+        G, GOtoGP = FA.G, FA.GOtoGP[a]
+        obsolete=[go for go in GOtoGP if G.isObsolete(go)]
+        unconnected=[go for go in GOtoGP if G.isUnconnected(go)]
+
+        return (sum(setSizes(GOtoGP)), len(GOtoGP), sum([len(GOtoGP[go]) for go in obsolete]), len(obsolete),
+                sum([len(GOtoGP[go]) for go in unconnected]))
+
+    return FA.derived(('annotationCounts', a), compute)
+
+#The update functions below are called by FuncAnnot.changed once the derived data of the modified aspects
+#are dropped. They are not deltas: the values of each aspect are computed again from data cached per aspect
+#by FuncAnnot, so only the modified aspects are counted again. coherence, compactness and informationContent
+#have no update function, they are dropped by FuncAnnot.changed.
+
+def _updateObsolete(FA):
+    counts=dict([(a, _annotationCounts(FA, a)) for a in FA.G.aspect])
+
+    allObsAnnot, allObsTerm = FA['obsolete'], FA['obsTerm']
+    for a in FA.G.aspect:
+        total, totalTerm, obs, obsTerm = counts[a][:4]
+        allObsAnnot[a]=100.* obs / total
+        allObsTerm[a]=100.* obsTerm / totalTerm
+
+    allObsAnnot['All_aspects_of_GO'] = 100.* sum([c[2] for c in counts.values()]) / sum([c[0] for c in counts.values()])
+    allObsTerm['All_aspects_of_GO'] = 100.* sum([c[3] for c in counts.values()]) / sum([c[1] for c in counts.values()])
+
+def _updateUnconnected(FA):
+    counts=dict([(a, _annotationCounts(FA, a)) for a in FA.G.aspect])
+
+    allUnconnected=FA['unconnected']
+    for a in FA.G.aspect:
+        allUnconnected[a]=100.* counts[a][4] / counts[a][0]
+
+    allUnconnected['All_aspects_of_GO'] = 100.* sum([c[4] for c in counts.values()]) / sum([c[0] for c in counts.values()])
+
+def _updateRedundancy(FA):
+    allRedundancy=FA['redundancy']
+    for a in FA.G.aspect:
+        nbRed=sum([len(redundant) for redundant in FA.redundant(a).itervalues()])
+        allRedundancy[a]= 100.0 * nbRed / _annotationCounts(FA, a)[0]
+
+    allRedundancy['All_aspects_of_GO'] = mean([allRedundancy[a] for a in FA.G.aspect])
+
+def _updateCoverage(FA):
+    allCoverage=FA['coverage']
+    for a in FA.G.aspect:
+        allCoverage[a]= (100.0 * len(FA.GPtoGO[a]) / len(FA.refSet) )
+
+    allCoverage['All_aspects_of_GO'] = (100.0 * len(FA['GA']) / len(FA.refSet))
+
+def _updateRichness(FA):
+    FA['richness']=_richness(FA)
+
+def _updateSpecificity(FA):
+    allSpecificity=FA['specificity']
+    for a in FA.G.aspect:
+        allSpecificity[a]=FA.derived(('specificity', a), lambda: _specificity(FA, a))
+
+    allSpecificity['All_aspects_of_GO'] = mean([mean(allSpecificity[a]) for a in FA.G.aspect])
+
+def _updateNumberAnnot(FA):
+    allNumberAnnot=FA['numberAnnot']
+    for a in FA.G.aspect:
+        allNumberAnnot[a]=FA.derived(('setSizes', a), lambda: setSizes(FA.GPtoGO[a]))
+
+    allNumberAnnot['All_aspects_of_GO'] = 1.*sum([sum(allNumberAnnot[a]) for a in FA.GPtoGO]) / sum([len(allNumberAnnot[a]) for a in FA.GPtoGO])
+
+rS.setUpdate("obsolete", _updateObsolete)
+rS.setUpdate("unconnected", _updateUnconnected)
+rS.setUpdate("redundancy", _updateRedundancy)
+rS.setUpdate("coverage", _updateCoverage)
+rS.setUpdate("richness", _updateRichness)
+rS.setUpdate("specificity", _updateSpecificity)
+rS.setUpdate("numberAnnot", _updateNumberAnnot)
+
+for statistics in ["redundancy", "coherence", "compactness", "specificity", "informationContent"]:
+    rS.setPerAspect(statistics)
+
+
 #------------------------------------------------------------------------------
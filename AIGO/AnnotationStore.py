@@ -0,0 +1,159 @@
+"""
+AnnotationStore.py
+
+AIGO is a python library for
+the Analysis and Inter-comparison of Gene Ontology functional annotations.
+see (http://code.google.com/p/aigo).
+
+Created by Michael Defoin-Platel on 21/02/2010.
+Copyright (c) 2010. All rights reserved.
+
+AIGO is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import Mapping
+
+import numpy as np
+
+
+class AnnotationView(Mapping):
+    """
+    Read-only, dict-like view of one direction of the annotations of an aspect (GPtoGO[aspect] or GOtoGP[aspect]).
+    The values of key i are values[codes[indptr[i]:indptr[i+1]]], returned as a set.
+    """
+
+    def __init__(self, keys, values, indptr, codes):
+        self.keys_=keys
+        self.index_=None
+        self.values_=values
+        self.indptr=indptr
+        self.codes=codes
+
+    @property
+    def index(self):
+        #Position of each key, built on first lookup
+        if self.index_ is None:
+            self.index_=dict(zip(self.keys_, xrange(len(self.keys_))))
+        return self.index_
+
+    def __getitem__(self, key):
+        i=self.index[key]
+        values=self.values_
+        return set([values[c] for c in self.codes[self.indptr[i]:self.indptr[i+1]].tolist()])
+
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __len__(self):
+        return len(self.keys_)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def has_key(self, key):
+        return key in self.index
+
+    def keys(self):
+        return list(self.keys_)
+
+    def sizes(self):
+        """
+        Return the number of values of each key, in iteration order
+        """
+        return np.diff(self.indptr)
+
+
+class AnnotationStore(object):
+    """
+    Columnar store of the annotations of a FuncAnnot.
+
+    Gene products and GO terms are interned: genes[i] and terms[j] are the ids of gene code i and term code j.
+    Each annotation is a (gene, term, aspect) triple of codes held in three arrays, sorted by aspect then gene.
+    For each aspect, GPtoGO[aspect] and GOtoGP[aspect] are read-only views over CSR indexes of these arrays
+    in both directions.
+    """
+
+    def __init__(self, genes, terms, gene, term, aspect, aspects):
+        self.genes, self.terms = genes, terms
+        self.aspects=list(aspects)
+
+        #Stable sort: the terms of a gene product keep the order in which they were given
+        key=aspect.astype(np.int64)*max(len(genes), 1) + gene
+        if (key[1:] < key[:-1]).any():
+            order=np.argsort(key, kind="mergesort")
+            gene, term, aspect = gene[order], term[order], aspect[order]
+        self.gene, self.term, self.aspect = gene, term, aspect
+
+        self.GPtoGO, self.GOtoGP = dict(), dict()
+        bounds=np.searchsorted(self.aspect, np.arange(len(self.aspects)+1))
+        for a, name in enumerate(self.aspects):
+            gene=self.gene[bounds[a]:bounds[a+1]]
+            term=self.term[bounds[a]:bounds[a+1]]
+
+            self.GPtoGO[name]=self._view(gene, term, self.genes, self.terms)
+
+            #gene is sorted: a stable sort by term orders by term then gene
+            order=np.argsort(term, kind="mergesort")
+            self.GOtoGP[name]=self._view(term[order], gene[order], self.terms, self.genes)
+
+    def _view(self, keys, codes, keyIds, valueIds):
+        #keys is sorted: one CSR row per distinct key
+        first=np.flatnonzero(np.r_[True, keys[1:]!=keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+        indptr=np.append(first, len(keys)).astype(np.int64)
+
+        return AnnotationView([keyIds[k] for k in keys[first].tolist()], valueIds, indptr, codes)
+
+    def __len__(self):
+        return len(self.gene)
+
+    def intids(self, G):
+        """
+        Return the array of the int values of the GO terms, indexed by term code
+        """
+        return np.array(G.GOtoInt(self.terms), dtype=np.int32)
+
+
+def fromMapping(GPtoGO, aspects):
+    """
+    Build an AnnotationStore from a GPtoGO mapping (aspect -> gene product -> set of GO terms)
+    """
+    genes, terms = list(), list()
+    geneCode, termCode = dict(), dict()
+
+    gene, term, aspect = list(), list(), list()
+    for a, name in enumerate(aspects):
+        for gp, GO in GPtoGO.get(name, dict()).iteritems():
+            g=geneCode.setdefault(gp, len(geneCode))
+            if g==len(genes):
+                genes.append(gp)
+            for go in GO:
+                t=termCode.setdefault(go, len(termCode))
+                if t==len(terms):
+                    terms.append(go)
+                gene.append(g)
+                term.append(t)
+        aspect.extend([a]*(len(gene)-len(aspect)))
+
+    return AnnotationStore(genes, terms, np.array(gene, dtype=np.int32), np.array(term, dtype=np.int32),
+                           np.array(aspect, dtype=np.int8), aspects)
+
+
+def setSizes(M):
+    """
+    Return the number of values of each key of a GPtoGO[aspect] or GOtoGP[aspect] mapping, in iteration order
+    """
+    if isinstance(M, AnnotationView):
+        return M.sizes().tolist()
+
+    return [len(M[k]) for k in M]
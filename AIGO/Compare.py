@@ -22,13 +22,19 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pylab import *
+import os
+import multiprocessing
+
+from numpy import *
 
 from itertools import combinations
 
 
 from AIGO import allAspect, logger, logFun
-from AIGO.Similarity import GOSet_PWSimilarity
+from AIGO.Similarity import GOSet_BatchPWSimilarity, GOSet_BatchOverlap
+
+#Effector and pairs of FA of the current parallel funcSim, inherited by the forked workers
+_pairs = None
 
 class CompareFA(dict):
     """
@@ -76,133 +82,135 @@ class CompareFA(dict):
     def venn(self, allFA):
         """
         Compute a N-dimensional venn diagramm between the N FAs
+        Each region is counted from the membership masks of the gene products, see membership.
         """
         venn = dict()
         for aspect in allAspect:
 
             venn[aspect]=dict()
 
-            S=dict()
-            for FA in allFA:
-                if aspect=="All_aspects_of_GO":
-                    S[FA.name]=FA['GA']
-                else:
-                    S[FA.name]=set(FA.GPtoGO[aspect].keys())
+            genes, masks = self.membership(allFA, aspect)
+            counts=bincount(masks, minlength=pow(2,len(allFA)))
 
             for i in arange(1, pow(2,len(allFA))):
-                n=list()
-                pl=list()
-                nl=list()
-                
-                for j,FA in enumerate(allFA):
-                    b=int(i)>> j & int(1)
-                    if b:
-                        n.append(FA.name)
-                        pl.append(S[FA.name])
-                    else:
-                        nl.append(S[FA.name])
-                    
-
-                if len(pl)==0:
-                    Pl=set()
-                else:
-                    Pl=reduce(lambda x,y: x.intersection(y), pl)
-
-                if len(nl)==0:
-                    Nl=set()
-                else:
-                    Nl=reduce(lambda x,y: x.union(y), nl)
-
-                venn[aspect]['@'.join(sorted(n))]=100.0 * len(Pl.difference(Nl)) / len(allFA[0].refSet)
+                n=[FA.name for j,FA in enumerate(allFA) if int(i)>> j & int(1)]
+                venn[aspect]['@'.join(sorted(n))]=100.0 * counts[i] / len(allFA[0].refSet)
 
         self['venn'] = venn
 
-
-    @logFun("Computing Functional Similarity")        
-    def funcSim(self, allFA):                
+    def membership(self, allFA, aspect):
         """
-        Compute Semantic Similarity between commonly annotated GP for all possible pairs of FA
+        Return the gene products annotated by at least one of the FAs for an aspect of GO, and an array of their
+        membership masks: bit j of a mask is set if the gene product is annotated by allFA[j].
+        The masks are kept until the annotations of one of the FAs are modified.
         """
-        
-        funcSim=dict()
-        for aspect in allAspect:
+        versions=[FA.version() for FA in allFA]
+        cached=self.__dict__.setdefault('vennMasks', dict()).get(aspect)
+        if _isCurrent(cached, versions):
+            return cached[1]
+
+        index=dict()
+        allIndex=list()
+        for FA in allFA:
             if aspect=="All_aspects_of_GO":
-                continue
-            
-            funcSim[aspect]=dict()
+                S=FA['GA']
+            else:
+                S=FA.GPtoGO[aspect]
+            allIndex.append([index.setdefault(g, len(index)) for g in S])
 
-            for twoFAs in combinations(allFA, 2):
+        masks=zeros(len(index), dtype=int64)
+        for j, idx in enumerate(allIndex):
+            masks[array(idx, dtype=int64)] |= 1 << j
 
-                #Order the two FAs
-                FA1,FA2=take(twoFAs,argsort([FA.name for FA in twoFAs]))
-                
-                logger.info("\tbetween %s and %s for %s" % (FA1.name, FA2.name, aspect))
+        genes=[None]*len(index)
+        for g, i in index.iteritems():
+            genes[i]=g
 
-                commonGene=self.getCommonGene(FA1, FA2, aspect)
-                
-                D=dict()
-                for g in commonGene:
-                    sim,l=GOSet_PWSimilarity(FA1.G, FA1.GPtoGO[aspect][g], FA2.GPtoGO[aspect][g])
-                    D[g]=(l[0],l[1])
+        self.vennMasks[aspect]=(versions, (genes, masks))
 
-                funcSim[aspect][(FA1.name, FA2.name)] = D
+        return genes, masks
 
-        aspect="All_aspects_of_GO"
+    def vennRegion(self, allFA, aspect, names):
+        """
+        Return the set of gene products of a region of the venn diagramm: annotated by the FAs named in names
+        and by none of the others
+        """
+        genes, masks = self.membership(allFA, aspect)
+        mask=sum([1 << j for j,FA in enumerate(allFA) if FA.name in names])
 
-        funcSim[aspect]=dict()
-        for twoFAs in combinations(allFA, 2):
+        return set([genes[i] for i in flatnonzero(masks==mask).tolist()])
 
-            #Order the two FAs
-            FA1,FA2=take(twoFAs,argsort([FA.name for FA in twoFAs]))
 
-            logger.info("\tbetween %s and %s for %s" % (FA1.name, FA2.name, aspect))
-                
-            commonGene=self.getCommonGene(FA1, FA2, aspect)
-
-            D=dict()
-            for g in commonGene:
-                D1=mean([ funcSim[a][(FA1.name, FA2.name)][g][0]  for a in allAspect if not a=="All_aspects_of_GO" if  funcSim[a][(FA1.name, FA2.name)].has_key(g) ])
-                D2=mean([ funcSim[a][(FA1.name, FA2.name)][g][1]  for a in allAspect if not a=="All_aspects_of_GO" if  funcSim[a][(FA1.name, FA2.name)].has_key(g) ])
-                D[g]=(D1,D2)
-            
-            funcSim[aspect][(FA1.name, FA2.name)] = D
+    @logFun("Computing Functional Similarity")        
+    def funcSim(self, allFA, metric="GS2", workers=None, **kargs):
+        """
+        Compute Semantic Similarity between commonly annotated GP for all possible pairs of FA
+        The commonly annotated GP of a pair are compared at once, see GOSet_BatchPWSimilarity.
+        With workers=N (N>1), the pairs of FA are shared by a pool of N forked processes.
+        """
+        global _pairs
+
+        #Order the two FAs
+        allPairs=[tuple(take(twoFAs,argsort([FA.name for FA in twoFAs]))) for twoFAs in combinations(allFA, 2)]
+
+        if workers > 1 and len(allPairs) > 1 and hasattr(os, "fork"):
+            _pairs=(self, allPairs, metric, kargs)
+            pool=multiprocessing.Pool(min(workers, len(allPairs)))
+            try:
+                results=pool.map(_pairFuncSim, range(len(allPairs)))
+            finally:
+                pool.close()
+                pool.join()
+                _pairs=None
+        else:
+            results=[self.pairFuncSim(FA1, FA2, metric, **kargs) for FA1, FA2 in allPairs]
 
-        self['funcSim'] = funcSim
+        funcSim=dict([(aspect, dict()) for aspect in allAspect])
+        for (FA1, FA2), D in zip(allPairs, results):
+            for aspect in allAspect:
+                commonGene, l1, l2 = D[aspect]
+                funcSim[aspect][(FA1.name, FA2.name)] = dict(zip(commonGene, zip(l1, l2)))
 
+        self['funcSim'] = funcSim
 
-    @logFun("Computing Verspoor et al. (2006) hierarchical precision")
-    def precision(self, allFA):
+    def pairFuncSim(self, FA1, FA2, metric="GS2", **kargs):
         """
-        Verspoor et al. (2006) hierarchical precision
+        Compute Semantic Similarity between the GP commonly annotated by FA1 and FA2, for each aspect of GO
+        Return for each aspect the lists of the GP and of their two similarity scores
         """
-
-        #The first FA is used as a Gold Standard
-        GS=allFA[0]
-        
-        precision=dict()
+        funcSim=dict()
+        sum1, sum2, count = dict(), dict(), dict()
         for aspect in allAspect:
             if aspect=="All_aspects_of_GO":
                 continue
 
-            precision[aspect] = dict()
-            for FA in allFA[1:]:
-                precision[aspect][(FA.name, GS.name)]=dict()
+            logger.info("\tbetween %s and %s for %s" % (FA1.name, FA2.name, aspect))
 
-                logger.info("\t%s vs %s for %s" % (FA.name, GS.name, aspect))
+            commonGene=list(self.getCommonGene(FA1, FA2, aspect))
+            l1, l2 = GOSet_BatchPWSimilarity(FA1.G, FA1.GPtoGO[aspect], FA2.GPtoGO[aspect], commonGene, metric, **kargs)
 
-                commonGene=self.getCommonGene(FA, GS, aspect)
-                for g in commonGene:
-                    r=list()
-                    for go in FA.GPtoGO[aspect][g]:
-                        aGO = set(FA.G.get_Ancestors(go))
-                        naGO = len(aGO)
+            funcSim[aspect]=(commonGene, l1, l2)
 
-                        maxSim = max([(1.0 * len(aGO.intersection(GS.G.get_Ancestors(gs))))/naGO for gs in GS.GPtoGO[aspect][g]])
-                        r.append(maxSim)
+            #Mean over the aspects in which the GP are commonly annotated
+            for g, d1, d2 in zip(commonGene, l1, l2):
+                sum1[g]=sum1.get(g, 0.) + d1
+                sum2[g]=sum2.get(g, 0.) + d2
+                count[g]=count.get(g, 0) + 1
+
+        aspect="All_aspects_of_GO"
+        logger.info("\tbetween %s and %s for %s" % (FA1.name, FA2.name, aspect))
+        commonGene=count.keys()
+        funcSim[aspect]=(commonGene, [sum1[g]/count[g] for g in commonGene], [sum2[g]/count[g] for g in commonGene])
 
-                    precision[aspect][(FA.name, GS.name)][g]=mean(r)
+        return funcSim
 
-        self['precision']=precision
+
+    @logFun("Computing Verspoor et al. (2006) hierarchical precision")
+    def precision(self, allFA):
+        """
+        Verspoor et al. (2006) hierarchical precision
+        """
+        self['precision']=self.hierarchicalPR(allFA)[0]
 
 
     @logFun("Computing Verspoor et al. (2006) hierarchical recall")
@@ -210,39 +218,59 @@ class CompareFA(dict):
         """
         Verspoor et al. (2006) hierarchical recall 
         """
+        self['recall']=self.hierarchicalPR(allFA)[1]
+
+
+    def hierarchicalPR(self, allFA):
+        """
+        Verspoor et al. (2006) hierarchical precision and recall of the FAs with respect to the first one.
+        Both are computed from the same common ancestors of the pairs of predicted and gold standard terms,
+        in one pass kept until the annotations of one of the FAs are modified.
+        """
+        versions=[FA.version() for FA in allFA]
+        cached=self.__dict__.get('verspoor')
+        if _isCurrent(cached, versions):
+            return cached[1]
 
         #The first FA is used as a Gold Standard
         GS=allFA[0]
 
-        recall=dict()
+        precision, recall = dict(), dict()
         for aspect in allAspect:
             if aspect=="All_aspects_of_GO":
                 continue
-            
-            recall[aspect] = dict()
+
+            precision[aspect], recall[aspect] = dict(), dict()
             for FA in allFA[1:]:
-                recall[aspect][(FA.name, GS.name)]=dict()
-            
                 logger.info("\t%s vs %s for %s" % (FA.name, GS.name, aspect))
 
-                commonGene=self.getCommonGene(FA, GS, aspect)
-                for g in commonGene:
-                    r=list()
-                    for gs in GS.GPtoGO[aspect][g]:
-                        aGS = set(FA.G.get_Ancestors(gs))
-                        naGS = len(aGS)
+                commonGene=list(self.getCommonGene(FA, GS, aspect))
+                l1, l2 = GOSet_BatchOverlap(FA.G, FA.GPtoGO[aspect], GS.GPtoGO[aspect], commonGene)
 
-                        maxSim = max([(1.0 * len(aGS.intersection(FA.G.get_Ancestors(go))))/naGS for go in FA.GPtoGO[aspect][g]])
-                        r.append(maxSim)
+                precision[aspect][(FA.name, GS.name)]=dict(zip(commonGene, l1))
+                recall[aspect][(FA.name, GS.name)]=dict(zip(commonGene, l2))
 
-                    recall[aspect][(FA.name, GS.name)][g]=mean(r)
+        self.verspoor=(versions, (precision, recall))
 
-        self['recall']=recall
+        return precision, recall
 
 
 
-    
-                
+def _isCurrent(cached, versions):
+    """
+    Return True if cached data, stored as (versions, data), was computed from FAs whose annotations have the given versions
+    """
+    if cached is None or not len(cached[0])==len(versions):
+        return False
 
+    return not False in [v is w for v, w in zip(cached[0], versions)]
 
 
+def _pairFuncSim(i):
+    """
+    Compute the functional similarity of the i-th pair of FA in a worker
+    """
+    effector, allPairs, metric, kargs = _pairs
+    FA1, FA2 = allPairs[i]
+
+    return effector.pairFuncSim(FA1, FA2, metric, **kargs)
@@ -22,17 +22,23 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pylab import *
+from numpy import *
 import csv
 
 from AIGO import logger, logFun
 from AIGO import IO
+from AIGO.Statistics import registerStat as rS
+from AIGO.AnnotationStore import fromMapping, setSizes
+from AIGO.InformationContent import fromFA
 
 
 class FuncAnnot(dict):
     """
     This class stores the mapping between gene products and GO terms.
     It also provides methods to compute statistis about this mapping.
+    With columnar=True, the mapping is kept in an AnnotationStore once read and GPtoGO, GOtoGP are read-only views.
+    The changes made by add, inter, removeGP and the remove* statistics are recorded in changeLog as lists of
+    added and removed (gene product, GO term, aspect) triples.
     """
 
     def __init__(self, name, refSet, G , **args):
@@ -43,6 +49,7 @@ class FuncAnnot(dict):
 
         self.status="Empty"
         self.GPtoGO, self.GOtoGP = dict(),dict()
+        self.changeLog=list()
 
         # set any keyword valued parameters
         for k,v in args.items():
@@ -51,28 +58,167 @@ class FuncAnnot(dict):
     def isEmpty(self):
         return self.status=="Empty"
 
+    def isColumnar(self):
+        return self.__dict__.get('columnar', False)
+
+    def compact(self):
+        """
+        Move the mapping to a columnar AnnotationStore, GPtoGO and GOtoGP become read-only views
+        """
+        if self.__dict__.get('store') is None:
+            self.store=fromMapping(self.GPtoGO, self.G.aspect)
+
+        self.GPtoGO, self.GOtoGP = dict(self.store.GPtoGO), dict(self.store.GOtoGP)
+
+    def expand(self):
+        """
+        Move the mapping back to dictionaries of sets, so that it can be modified
+        """
+        if self.__dict__.get('store') is None:
+            return
+
+        self.GPtoGO=dict([(a, dict(self.GPtoGO[a].iteritems())) for a in self.GPtoGO])
+        self.GOtoGP=dict([(a, dict(self.GOtoGP[a].iteritems())) for a in self.GOtoGP])
+        self.store=None
+
+    def derived(self, key, compute):
+        """
+        Return the data derived from the annotations under key, computed by compute() the first time
+        and cached until the annotations are modified
+        """
+        cache=self.__dict__.setdefault('derivedCache', dict())
+        if not cache.has_key(key):
+            cache[key]=compute()
+
+        return cache[key]
+
+    def modified(self, aspects=None):
+        """
+        Drop the cached derived data of some aspects (all by default), to be called whenever GPtoGO or GOtoGP change
+        """
+        if aspects is None:
+            self.derivedCache=dict()
+        else:
+            cache=self.__dict__.get('derivedCache', dict())
+            for key in [key for key in cache if key[1] is None or key[1] in aspects]:
+                del cache[key]
+
+    def changed(self, added, removed, genes=(), aspects=()):
+        """
+        Record a change of the annotations, made in GPtoGO and GOtoGP, given as the lists of added and removed
+        (gene product, GO term, aspect) triples, plus the gene products that gained or lost an empty set and
+        the aspects where empty sets were added or removed.
+        The set of annotated gene products and the derived data of the modified aspects are updated, then
+        the statistics already stored are updated if they register an update function, dropped otherwise.
+        """
+        self.__dict__.setdefault('changeLog', list()).append((added, removed))
+        self.modified(set([a for gp, go, a in added]) | set([a for gp, go, a in removed]) | set(aspects))
+
+        GA=self.setdefault('GA', set())
+        for gp in set([gp for gp, go, a in added]) | set([gp for gp, go, a in removed]) | set(genes):
+            if True in [self.GPtoGO.get(a, dict()).has_key(gp) for a in self.G.aspect]:
+                GA.add(gp)
+            else:
+                GA.discard(gp)
+
+        for statistics in rS.getAll():
+            keys=[k for k in rS.getKeys(statistics) if self.has_key(k)]
+            if len(keys)==0:
+                continue
+
+            update=rS.getUpdate(statistics)
+            if update is not None:
+                try:
+                    update(self)
+                    continue
+                except Exception, e:
+                    logger.handleWarning("Unable to update %s: %s" % (statistics, str(e)))
+
+            logger.info("%s is out of date and removed" % statistics)
+            for k in keys:
+                if self.has_key(k):
+                    del self[k]
+
+    def redundant(self, aspect):
+        """
+        Return the redundant annotations (ancestors of another annotation of the same gene product)
+        of the gene products of an aspect, as a dictionary holding only the gene products with redundant annotations
+        """
+        return self.derived(('redundant', aspect), lambda: self.G.get_MostSpecific(self.GPtoGO[aspect])[0])
+
+    def termTable(self, aspect):
+        """
+        Return the GO terms annotated in an aspect and, as arrays in the same order, their number of
+        annotated gene products, their number of ancestors and whether they are obsolete or unconnected
+        """
+        def compute():
+            G=self.G
+            terms=list(self.GOtoGP[aspect])
+            counts=array(setSizes(self.GOtoGP[aspect]), dtype=int)
+            ancestors=array([len(G.ancestors(intid)) for intid in G.GOtoInt(terms)], dtype=int)
+            obsolete=array([G.isObsolete(goid) for goid in terms], dtype=bool)
+            unconnected=array([G.isUnconnected(goid) for goid in terms], dtype=bool)
+            return terms, counts, ancestors, obsolete, unconnected
+
+        return self.derived(('terms', aspect), compute)
+
+    def inducedCounts(self, aspect):
+        """
+        Return the number of gene products of an aspect whose annotations or their ancestors include each GO term
+        (int ids), as used by the GS2 measure
+        """
+        return self.derived(('induced', aspect), lambda: self.G.GS2Counts([self.G.GOtoInt(GO) for GO in self.GPtoGO[aspect].itervalues()]))
+
+    def IC(self):
+        """
+        Return the information content of the GO terms computed from these annotations, as an ICTable
+        """
+        return self.derived(('IC', None), lambda: fromFA([self]))
+
+    def annotationStore(self):
+        """
+        Return the annotations as an AnnotationStore: the store of a columnar FA, or one built from GPtoGO
+        and cached until the annotations are modified
+        """
+        if self.__dict__.get('store') is not None:
+            return self.store
+
+        return self.derived(('store', None), lambda: fromMapping(self.GPtoGO, self.G.aspect))
+
+    def version(self):
+        """
+        Return a token identifying the current state of the annotations: a new token is created whenever they are modified
+        """
+        return self.derived(('version', None), object)
+
     @logFun("Adding functional annotation")
     def add(self, FA):
         logger.info("Name :\t%s" % self.name)
+        self.expand()
         
+        added, genes, aspects = list(), list(), set()
         for aspect in FA.GPtoGO:
             if not self.GPtoGO.has_key(aspect):
                 self.GPtoGO[aspect]=dict()
-                
-            for gp in FA.GPtoGO[aspect]:                
-                self.GPtoGO[aspect].setdefault(gp, set()).update(FA.GPtoGO[aspect][gp])
-
-        for aspect in FA.GOtoGP:
             if not self.GOtoGP.has_key(aspect):
                 self.GOtoGP[aspect]=dict()
                 
-            for go in FA.GOtoGP[aspect]:
-                self.GOtoGP[aspect].setdefault(go, set()).update(FA.GOtoGP[aspect][go])
-
-        self['GA']=set()
-        for a in  self.G.aspect:
-            self['GA']=self['GA']  | set(self.GPtoGO[a].keys())
-
+            for gp in FA.GPtoGO[aspect]:
+                if not self.GPtoGO[aspect].has_key(gp):
+                    genes.append(gp)
+                    aspects.add(aspect)
+                GO=self.GPtoGO[aspect].setdefault(gp, set())
+
+                for go in FA.GPtoGO[aspect][gp]:
+                    if not go in GO:
+                        GO.add(go)
+                        self.GOtoGP[aspect].setdefault(go, set()).add(gp)
+                        added.append((gp, go, aspect))
+
+        if self.isColumnar():
+            self.compact()
+
+        self.changed(added, [], genes, aspects)
         logger.info ("%d gene products are annotated" % (len(self['GA'])))
 
         self.status="Loaded"
@@ -83,30 +229,34 @@ class FuncAnnot(dict):
     @logFun("Intersecting with another functional annotation")
     def inter(self, FA):
         logger.info("Name :\t%s" % self.name)
+        self.expand()
         
+        #Gene products and GO terms found in both keep their (possibly empty) set
+        removed=list()
         for aspect in self.GPtoGO:
-            if not FA.GPtoGO.has_key(aspect):
-                self.GPtoGO[aspect]=dict()
-            else:
-                for gp in set(self.GPtoGO[aspect].keys()).difference(FA.GPtoGO[aspect]):
-                    del self.GPtoGO[aspect][gp]
-                    
-                for gp in set(self.GPtoGO[aspect].keys()).intersection(FA.GPtoGO[aspect]):
-                    self.GPtoGO[aspect][gp].intersection_update(FA.GPtoGO[aspect][gp])
+            other=FA.GPtoGO.get(aspect, dict())
+
+            for gp in self.GPtoGO[aspect].keys():
+                if not other.has_key(gp):
+                    lost=self.GPtoGO[aspect].pop(gp)
+                else:
+                    lost=self.GPtoGO[aspect][gp].difference(other[gp])
+                    self.GPtoGO[aspect][gp].difference_update(lost)
+                removed.extend([(gp, go, aspect) for go in lost])
+
+        for gp, go, aspect in removed:
+            if self.GOtoGP[aspect].has_key(go):
+                self.GOtoGP[aspect][go].discard(gp)
 
         for aspect in self.GOtoGP:
-            if not FA.GOtoGP.has_key(aspect):
-                self.GOtoGP[aspect]=dict()
-            else:
-                for go in set(self.GOtoGP[aspect].keys()).difference(FA.GOtoGP[aspect].keys()):
-                    del self.GOtoGP[aspect][go]
-                for go in set(self.GOtoGP[aspect].keys()).intersection(FA.GOtoGP[aspect].keys()):
-                    self.GOtoGP[aspect][go].intersection_update(FA.GOtoGP[aspect][go])
+            other=FA.GOtoGP.get(aspect, dict())
+            for go in [go for go in self.GOtoGP[aspect] if not other.has_key(go)]:
+                del self.GOtoGP[aspect][go]
 
-        self['GA']=set()
-        for a in  self.G.aspect:
-            self['GA']=self['GA']  | set(self.GPtoGO[a].keys())
+        if self.isColumnar():
+            self.compact()
 
+        self.changed([], removed, aspects=self.GPtoGO.keys())
         logger.info ("%d gene products are annotated" % (len(self['GA'])))
 
         self.status="Loaded"
@@ -118,27 +268,33 @@ class FuncAnnot(dict):
     @logFun("Remove gene products and their annotations")
     def removeGP(self, GP, myAspects=None):
         logger.info("Name :\t%s" % self.name)
+        self.expand()
 
         if myAspects==None:
             myAspects=self.GPtoGO
         
+        removed, genes, aspects = list(), list(), set()
         for aspect in myAspects:
             for g in GP:
                 if self.GPtoGO[aspect].has_key(g):
-                    del self.GPtoGO[aspect][g]
+                    genes.append(g)
+                    aspects.add(aspect)
+                    for go in self.GPtoGO[aspect].pop(g):
+                        self.GOtoGP[aspect][go].discard(g)
+                        removed.append((g, go, aspect))
 
-        self.GOtoGP=dict()
+        #GO terms left without gene product, e.g. by inter, are removed from every aspect
         for aspect in self.G.aspect:
-            self.GOtoGP[aspect]=dict()
-
-            for gp in self.GPtoGO[aspect]:
-                for go in self.GPtoGO[aspect][gp]:
-                    self.GOtoGP[aspect].setdefault(go, set()).add(gp)
+            empty=[go for go, genesOf in self.GOtoGP.get(aspect, dict()).iteritems() if len(genesOf)==0]
+            for go in empty:
+                del self.GOtoGP[aspect][go]
+            if len(empty) > 0:
+                aspects.add(aspect)
 
-        self['GA']=set()
-        for a in  self.G.aspect:
-            self['GA']=self['GA']  | set(self.GPtoGO[a].keys())
+        if self.isColumnar():
+            self.compact()
 
+        self.changed([], removed, genes, aspects)
         logger.info ("%d gene products are annotated" % (len(self['GA'])))
 
         self.status="Loaed"
@@ -156,13 +312,13 @@ class FuncAnnot(dict):
             for gp in self.GPtoGO[aspect]:
                 for go in self.GPtoGO[aspect][gp]:
                     if not gp in self.GOtoGP[aspect][go]:
-                        logger.handleWarning ("%s not found in GOtoGP[%s][%s]" % (gp,aspect,go))
+                        logger.countWarning("%s not found in GOtoGP[%s][%s]", (gp,aspect,go))
                         valid=False
 
             for go in self.GOtoGP[aspect]:
                 for gp in self.GOtoGP[aspect][go]:
                     if not go in self.GPtoGO[aspect][gp]:
-                        logger.handleWarning ("%s not found in GPtoGO[%s][%s]" % (go,aspect,gp))
+                        logger.countWarning("%s not found in GPtoGO[%s][%s]", (go,aspect,gp))
                         valid=False
 
 
@@ -182,6 +338,9 @@ class FuncAnnot(dict):
         """
 
         logger.info("Name :\t%s" % self.name)
+        self.store=None
+        self.modified()
+        self.changeLog=list()
 
         if not fileName=="":
             self.__dict__['fileName'] = fileName
@@ -199,7 +358,9 @@ class FuncAnnot(dict):
         logger.info("%s file : \t%s " % (fileType, fileName ) )
 
         try:
-            if fileType=="GAF":
+            if fileType=="GAF" and self.isColumnar():
+                self.store = IO.extract_GAF(self.fileName, self.G, refSet=self.refSet, columnar=True)
+            elif fileType=="GAF":
                 self.GPtoGO, self.GOtoGP = IO.extract_GAF(self.fileName, self.G, refSet=self.refSet)
             elif fileType=="B2G":
                 self.GPtoGO, self.GOtoGP = IO.extract_GP2GO(self.fileName, self.G, refSet=self.refSet)
@@ -220,16 +381,55 @@ class FuncAnnot(dict):
             logger.handleFatal("Unable to read file %s: %s" % (fileName, str(e)))
 
         else:            
-            #Find the set of annotated gene products
-            self['GA']=set()
-            for a in  self.G.aspect:
-                self['GA']=self['GA']  | set(self.GPtoGO[a].keys())
+            self.loaded()
+
+    def loaded(self):
+        """
+        Finalize a newly read mapping: find the set of annotated gene products and set the status
+        """
+        if self.isColumnar():
+            self.compact()
 
-            logger.info ("%d gene products are annotated" % (len(self['GA'])))
+        #Find the set of annotated gene products
+        self['GA']=set()
+        for a in  self.G.aspect:
+            self['GA']=self['GA']  | set(self.GPtoGO[a].keys())
 
-            self.status="Loaded"
-            
-            for  a in self.G.aspect:
-                logger.info ("%s : %.2f annotations per set" % (a, mean([len(self.GPtoGO[a][gp]) for gp in self.GPtoGO[a]])))
+        logger.info ("%d gene products are annotated" % (len(self['GA'])))
+
+        self.status="Loaded"
+
+        for  a in self.G.aspect:
+            logger.info ("%s : %.2f annotations per set" % (a, mean([len(self.GPtoGO[a][gp]) for gp in self.GPtoGO[a]])))
+
+
+@logFun("Reading functional annotations by evidence code")
+def readByEvidence(fileName, refSet, G, evidenceGroups=None, **args):
+    """
+    Read a GAF file once and return a dictionary of FuncAnnot, one per evidence code.
+    evidenceGroups maps the name of each FuncAnnot to a list of evidence codes, e.g. {"AHC": ["IC", "ISS", "NAS"]}.
+    Other keyword arguments are passed to FuncAnnot (e.g. organism, columnar).
+    """
+
+    columnar=args.get('columnar', False)
+    try:
+        allMapping=IO.extract_GAFByEvidence(fileName, G, refSet=refSet, evidenceGroups=evidenceGroups, columnar=columnar)
+    except Exception, e:
+        logger.handleFatal("Unable to read file %s: %s" % (fileName, str(e)))
+
+    allFA=dict()
+    for name in sorted(allMapping):
+        logger.info("Name :\t%s" % name)
+
+        FA=FuncAnnot(name, refSet, G, fileName=fileName, fileType="GAF", **args)
+        if columnar:
+            FA.store=allMapping[name]
+        else:
+            FA.GPtoGO, FA.GOtoGP = allMapping[name]
+
+        FA.loaded()
+        allFA[name]=FA
+
+    return allFA
 
 
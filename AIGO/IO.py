@@ -22,18 +22,24 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pylab import *
+from numpy import *
 import os, csv
 import re
 
-from itertools import izip
+from itertools import izip, chain
+from array import array as typedArray
 
-from AIGO import logger
+import numpy as np
+
+from AIGO import logger, summarizeWarnings
 from AIGO.utils.File  import checkForZip, readFile
+from AIGO.utils.Logger import LogProgress
+from AIGO.AnnotationStore import AnnotationStore
 
 IOType={"GO Annotation File":"GAF", "Blast2GO":"B2G", "Affymetrix":"AFFY", "ArrayIDer":"AID", "Mapping GPid GOids": "GP2GO"}
 
 #-------------------------------------------------------
+@summarizeWarnings
 def extract_GP2GO(fileName, G, refSet=None, sep1='\t', sep2=',', comments='#', skiprows=0):
     """
     Read a functional annotation mapping file of the form
@@ -60,7 +66,7 @@ def extract_GP2GO(fileName, G, refSet=None, sep1='\t', sep2=',', comments='#', s
     for g,go in data:
 
         if not hasRef is None and not hasRef.has_key(g):
-            logger.handleWarning("gene product %s is not in the reference set, skip it " % g)
+            logger.countWarning("gene product %s is not in the reference set, skip it ", g)
             continue
 
         for term in go.split(sep2):
@@ -73,7 +79,7 @@ def extract_GP2GO(fileName, G, refSet=None, sep1='\t', sep2=',', comments='#', s
             term, aspect=G.get_GOAlternative(term, nameSpace=True)
 
             if not aspect:
-                logger.handleWarning("%s: term %s is not in GO graph, skip it " % (g, term))
+                logger.countWarning("%s: term %s is not in GO graph, skip it ", (g, term))
                 continue
 
             GenetoGO[aspect].setdefault(g, set([])).add(term)
@@ -82,6 +88,7 @@ def extract_GP2GO(fileName, G, refSet=None, sep1='\t', sep2=',', comments='#', s
     return GenetoGO, GOtoGene
 
 
+@summarizeWarnings
 def extract_GO2GP(fileName, G, refSet=None, sep1='\t', sep2=',', comments='#', skiprows=0):
     """
     Read a functional annotation mapping file of the form
@@ -114,14 +121,14 @@ def extract_GO2GP(fileName, G, refSet=None, sep1='\t', sep2=',', comments='#', s
         term, aspect=G.get_GOAlternative(go, nameSpace=True)
 
         if not aspect:
-            logger.handleWarning("term %s is not in GO graph, skip it " % (term))
+            logger.countWarning("term %s is not in GO graph, skip it ", term)
             continue
 
         for gp in GP.split(sep2):
             gp = gp.strip();
 
             if not hasRef is None and not hasRef.has_key(gp):
-                logger.handleWarning("gene product %s is not in the reference set, skip it " % gp)
+                logger.countWarning("gene product %s is not in the reference set, skip it ", gp)
                 continue
 
             GenetoGO[aspect].setdefault(gp, set([])).add(go)
@@ -131,6 +138,7 @@ def extract_GO2GP(fileName, G, refSet=None, sep1='\t', sep2=',', comments='#', s
 
 
 
+@summarizeWarnings
 def extract_AID(fileName, G, refSet=None):
     fileName= checkForZip(fileName)
     if (not os.path.exists(fileName)):
@@ -154,7 +162,7 @@ def extract_AID(fileName, G, refSet=None):
         go=row[header.index('GO:ID')]
 
         if hasRef and not hasRef.has_key(g):
-            logger.handleWarning("gene product %s is not in the reference set, skip it " % g)
+            logger.countWarning("gene product %s is not in the reference set, skip it ", g)
             continue
 
         if go.find('GO:')==0:
@@ -162,7 +170,7 @@ def extract_AID(fileName, G, refSet=None):
             #Get the alternative term if any and its GO aspect
             go, aspect=G.get_GOAlternative(go, nameSpace=True)
             if not aspect:
-                logger.handleWarning("term %s is not in GO graph, skip it " % go)
+                logger.countWarning("term %s is not in GO graph, skip it ", go)
                 continue
 
             GenetoGO[aspect].setdefault(g, set([])).add(go)
@@ -173,6 +181,7 @@ def extract_AID(fileName, G, refSet=None):
 
 #Affymetrix TAF format
 #http://www.affymetrix.com/support/technical/manual/taf_manual.affx
+@summarizeWarnings
 def extract_Affy(fileName, G, refSet=None, GO_columns=[30, 31, 32], filetype="Affy", delimiter=',', quoting=csv.QUOTE_ALL):
     fileName= checkForZip(fileName)
     if (not os.path.exists(fileName)):
@@ -205,7 +214,7 @@ def extract_Affy(fileName, G, refSet=None, GO_columns=[30, 31, 32], filetype="Af
         g=row[0]
 
         if hasRef and not hasRef.has_key(g):
-            logger.handleWarning("gene product %s is not in the reference set, skip it " % g)
+            logger.countWarning("gene product %s is not in the reference set, skip it ", g)
             continue
 
         for aspect, i in zip(['biological_process', 'cellular_component', 'molecular_function'], GO_columns):
@@ -215,7 +224,7 @@ def extract_Affy(fileName, G, refSet=None, GO_columns=[30, 31, 32], filetype="Af
 
                     go, aspect=G.get_GOAlternative(go, nameSpace=True)
                     if not aspect:
-                        logger.handleWarning("term %s is not in GO graph, skip it " % go)
+                        logger.countWarning("term %s is not in GO graph, skip it ", go)
                         continue
                     GenetoGO[aspect].setdefault(g, set([])).add(go)
                     GOtoGene[aspect].setdefault(go, set([])).add(g)
@@ -223,29 +232,115 @@ def extract_Affy(fileName, G, refSet=None, GO_columns=[30, 31, 32], filetype="Af
     return GenetoGO, GOtoGene
 
 
-def readGAF_2(fileName):
-    GAF_col=["DB","DB Object ID","DB Object Symbol","Qualifier",
-             "GO ID","DB:Reference","Evidence Code","With (or) From",
-             "Aspect","DB Object Name","DB Object Synonym","DB Object Type",
-             "Taxon(|taxon)","Date","Assigned By","Annotation Extension","Gene Product Form ID"]
+GAF_col=["DB","DB Object ID","DB Object Symbol","Qualifier",
+         "GO ID","DB:Reference","Evidence Code","With (or) From",
+         "Aspect","DB Object Name","DB Object Synonym","DB Object Type",
+         "Taxon(|taxon)","Date","Assigned By","Annotation Extension","Gene Product Form ID"]
 
-    #Read the entire file
-    data=[row for row in csv.reader(readFile(fileName), delimiter="\t")]
+def _rawPosition(f):
+    """
+    Position in the file on disk, i.e. in the compressed stream for gzip files, None if unknown
+    """
+    try:
+        return getattr(f, 'fileobj', f).tell()
+    except Exception:
+        return None
+
+def iterGAF(fileName, chunkSize=10000):
+    """
+    Stream the rows of a GAF 2.x file by chunks (lists) of at most chunkSize rows.
+    Only the header and the current chunk are held in memory. Progress is reported with LogProgress.
+    """
+    f=readFile(fileName)
 
     #Read the header
-    seek=0
     GAF_OK=False
-    while data[seek][0][0]=="!":
-        if re.search("!.*gaf-version.*:.*2",data[seek][0]):
+    line=f.readline()
+    while line.startswith("!"):
+        if re.search("!.*gaf-version.*:.*2", line):
             GAF_OK=True
-        seek=seek+1
+        line=f.readline()
 
     if not GAF_OK:
+        f.close()
         raise Exception("Sorry, GAF format version 2.0 expected.")
 
-    return iter(data[seek:]), GAF_col
+    progress, last = None, _rawPosition(f)
+    if last is not None:
+        progress=LogProgress(os.path.getsize(fileName))
+
+    try:
+        chunk=list()
+        for row in csv.reader(chain([line], f), delimiter="\t"):
+            if len(row)==0:
+                continue
+
+            chunk.append(row)
+            if len(chunk)==chunkSize:
+                if progress:
+                    position=_rawPosition(f)
+                    progress.update(max(position-last, 1))
+                    last=position
+                yield chunk
+                chunk=list()
+
+        if len(chunk) > 0:
+            yield chunk
+    finally:
+        if progress and progress.start is not None:
+            progress.finished()
+        f.close()
+
+def readGAF_2(fileName):
+    """
+    Return an iterator on the rows of a GAF 2.x file and the list of its columns
+    """
+    return chain.from_iterable(iterGAF(fileName)), GAF_col
+
+@summarizeWarnings
+def extract_GAF(fileName, G, refSet=None, columnar=False, chunkSize=10000):
+    """
+    Read a GAF 2.x file chunk by chunk.
+    With columnar, the annotations are returned as an AnnotationStore instead of the GPtoGO, GOtoGP dictionaries,
+    so that no set is ever built.
+    """
+
+    return _readGAF(fileName, G, refSet, columnar, chunkSize)[None]
+
+
+@summarizeWarnings
+def extract_GAFByEvidence(fileName, G, refSet=None, evidenceGroups=None, columnar=False, chunkSize=10000):
+    """
+    Read a GAF 2.x file once and split its annotations by evidence code.
+    evidenceGroups maps a group name to a list of evidence codes, e.g. {"AHC": ["IC", "ISS", "NAS"]}, a code may
+    belong to several groups. By default, there is one group per evidence code found in the file.
+    Return a dictionary group -> (GPtoGO, GOtoGP), or group -> AnnotationStore with columnar.
+    """
+
+    if evidenceGroups is None:
+        groupsOf=lambda code: [code]
+    else:
+        codeGroups=dict()
+        for group, codes in evidenceGroups.items():
+            for code in codes:
+                codeGroups.setdefault(code, list()).append(group)
+        groupsOf=lambda code: codeGroups.get(code, [])
+
+    allMapping=_readGAF(fileName, G, refSet, columnar, chunkSize, groupsOf)
+
+    #Groups without any annotation
+    for group in (evidenceGroups or dict()):
+        if not allMapping.has_key(group):
+            allMapping[group]=_emptyMapping(G, columnar)
 
-def extract_GAF(fileName, G, refSet=None):
+    return allMapping
+
+
+def _readGAF(fileName, G, refSet, columnar, chunkSize, groupsOf=None):
+    """
+    Read a GAF 2.x file, the annotations of each row are added to the groups groupsOf(evidence code)
+    (a single group None if groupsOf is None). Return a dictionary group -> mapping
+    """
 
     fileName= checkForZip(fileName)
     if (not os.path.exists(fileName)):
@@ -255,41 +350,102 @@ def extract_GAF(fileName, G, refSet=None):
     if refSet:
         refRef=dict(izip(refSet, refSet))
 
-    GenetoGO, GOtoGene = dict(), dict()
-    for aspect in G.aspect:
-        GenetoGO[aspect], GOtoGene[aspect] =dict(), dict()
+    #Interned gene products and terms, shared by the columnar stores of all the groups
+    genes, terms, geneCode, termCode = list(), list(), dict(), dict()
+    aspectCode=dict([(a, i) for i, a in enumerate(G.aspect)])
 
-    data,GAF_col = readGAF_2(fileName)
+    def newGroup():
+        if columnar:
+            return typedArray('i'), typedArray('i'), typedArray('b')
+        return _emptyMapping(G, columnar)
 
-    for row in data:
-        #g=row[GAF_col.index("DB Object Symbol")]
-        g=".".join([row[GAF_col.index("Taxon(|taxon)")][6:],row[GAF_col.index("DB Object Symbol")]])
+    allGroup=dict()
+    if groupsOf is None:
+        allGroup[None]=newGroup()
 
-        go=row[GAF_col.index('GO ID')]
+    #Column positions
+    iTaxon, iSymbol, iGO, iQualifier, iEvidence = [GAF_col.index(c) for c in ["Taxon(|taxon)", "DB Object Symbol", "GO ID", "Qualifier", "Evidence Code"]]
 
-        if not row[GAF_col.index('Qualifier')].find('NOT')==-1:
-            logger.handleWarning("go term %s for gene product %s is qualified as NOT: ignored" % (go, g))
-            continue
-
-        if hasRef and not hasRef.has_key(g):
-            logger.handleWarning("gene product %s is not in the reference set, skip it " % g)
-            continue
+    for data in iterGAF(fileName, chunkSize):
+        for row in data:
+            #g=row[iSymbol]
+            g=".".join([row[iTaxon][6:],row[iSymbol]])
 
-        if go.find('GO:')==0:
+            go=row[iGO]
 
-            go, aspect=G.get_GOAlternative(go, nameSpace=True)
+            if not row[iQualifier].find('NOT')==-1:
+                logger.countWarning("go term %s for gene product %s is qualified as NOT: ignored", (go, g))
+                continue
 
-            if not aspect:
-                logger.handleWarning("term %s is not in GO graph, skip it " % go)
+            if hasRef and not hasRef.has_key(g):
+                logger.countWarning("gene product %s is not in the reference set, skip it ", g)
                 continue
 
-            GenetoGO[aspect].setdefault(g, set([])).add(go)
-            GOtoGene[aspect].setdefault(go,set([])).add(g)
+            if go.find('GO:')==0:
+
+                go, aspect=G.get_GOAlternative(go, nameSpace=True)
+
+                if not aspect:
+                    logger.countWarning("term %s is not in GO graph, skip it ", go)
+                    continue
+
+                if groupsOf is None:
+                    groups=[allGroup[None]]
+                else:
+                    groups=list()
+                    for group in groupsOf(row[iEvidence]):
+                        if not allGroup.has_key(group):
+                            allGroup[group]=newGroup()
+                        groups.append(allGroup[group])
+
+                if columnar:
+                    c=geneCode.setdefault(g, len(genes))
+                    if c==len(genes):
+                        genes.append(g)
+                    t=termCode.setdefault(go, len(terms))
+                    if t==len(terms):
+                        terms.append(go)
+
+                    for allGene, allTerm, allAspect in groups:
+                        allGene.append(c)
+                        allTerm.append(t)
+                        allAspect.append(aspectCode[aspect])
+                else:
+                    for GenetoGO, GOtoGene in groups:
+                        GenetoGO[aspect].setdefault(g, set([])).add(go)
+                        GOtoGene[aspect].setdefault(go,set([])).add(g)
+
+    if columnar:
+        for group, (allGene, allTerm, allAspect) in allGroup.items():
+            allGroup[group]=_toStore(genes, terms, allGene, allTerm, allAspect, G.aspect)
+
+    return allGroup
+
+def _emptyMapping(G, columnar):
+    if columnar:
+        return _toStore(list(), list(), typedArray('i'), typedArray('i'), typedArray('b'), G.aspect)
 
+    GenetoGO, GOtoGene = dict(), dict()
+    for aspect in G.aspect:
+        GenetoGO[aspect], GOtoGene[aspect] =dict(), dict()
     return GenetoGO, GOtoGene
 
+def _toStore(genes, terms, allGene, allTerm, allAspect, aspects):
+    """
+    Build an AnnotationStore from arrays of gene, term and aspect codes, keeping the first occurrence of each annotation
+    """
+    gene=np.array(np.frombuffer(allGene, dtype=np.intc) if len(allGene) else [], dtype=np.int32)
+    term=np.array(np.frombuffer(allTerm, dtype=np.intc) if len(allTerm) else [], dtype=np.int32)
+    aspect=np.array(np.frombuffer(allAspect, dtype=np.int8) if len(allAspect) else [], dtype=np.int8)
+
+    key=gene.astype(np.int64)*max(len(terms), 1) + term
+    first=np.sort(np.unique(key, return_index=True)[1])
+
+    return AnnotationStore(genes, terms, gene[first], term[first], aspect[first], aspects)
+
 
 
+@summarizeWarnings
 def extract_SCOP(fileName, G, refSet=None):
     fileName= checkForZip(fileName)
     if (not os.path.exists(fileName)):
@@ -314,7 +470,7 @@ def extract_SCOP(fileName, G, refSet=None):
         go=row[header.index('termGo')]
 
         if hasRef and not hasRef.has_key(g):
-            logger.handleWarning("gene product %s is not in the reference set, skip it " % g)
+            logger.countWarning("gene product %s is not in the reference set, skip it ", g)
             continue
 
         if go.find('GO:')==0:
@@ -322,7 +478,7 @@ def extract_SCOP(fileName, G, refSet=None):
             go, aspect=G.get_GOAlternative(go, nameSpace=True)
 
             if not aspect:
-                logger.handleWarning("term %s is not in GO graph, skip it " % term)
+                logger.countWarning("term %s is not in GO graph, skip it ", term)
                 continue
 
             GenetoGO[aspect].setdefault(g, set([])).add(go)
@@ -0,0 +1,281 @@
+"""
+InformationContent.py
+
+AIGO is a python library for
+the Analysis and Inter-comparison of Gene Ontology functional annotations.
+see (http://code.google.com/p/aigo).
+
+Created by Michael Defoin-Platel on 21/02/2010.
+Copyright (c) 2010. All rights reserved.
+
+AIGO is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+
+class ICTable(object):
+    """
+    Information content of the GO terms of a graph, held in a dense array over the rows of its CSR view:
+    ic[r] = -log(n(r)/n(root)), where n(r) is the number of annotations to the term of row r or to its
+    descendants and n(root) the largest count in the aspect of the term. Terms with no such annotation are nan.
+
+    IC[aspect][intid] gives the information content of a term, like the dictionaries expected by Resnik.
+    """
+
+    def __init__(self, G, counts):
+        self.G=G
+        self.csr=G.get_CSR()
+        self.counts=counts
+
+        aspects=[G.GONameSpace.get(intid) for intid in self.csr.terms.tolist()]
+        self.aspect=np.array([G.aspect.index(a) if a in G.aspect else -1 for a in aspects], dtype=np.int8)
+
+        self.ic=np.empty(len(self.csr))
+        self.ic.fill(np.nan)
+        for a in range(len(G.aspect)):
+            rows=np.flatnonzero((self.aspect==a) & (counts > 0))
+            if len(rows) > 0:
+                self.ic[rows]=-1. * np.log(1.*counts[rows]/counts[rows].max())
+
+    def __getitem__(self, aspect):
+        return _AspectIC(self, self.G.aspect.index(aspect))
+
+    def get(self, aspect, default=None):
+        if aspect in self.G.aspect:
+            return self[aspect]
+        return default
+
+    def rows(self, GO):
+        """
+        Return the rows of a list of GO ids (-1 for terms not in the graph)
+        """
+        row=self.csr.row
+        return np.array([row.get(intid, -1) for intid in self.G.GOtoInt(GO)], dtype=np.int64)
+
+    def values(self, GO):
+        """
+        Return the list of the information contents of a list of GO ids, nan if unknown
+        """
+        return self._values(GO).tolist()
+
+    def _values(self, GO):
+        rows=self.rows(GO)
+        values=np.empty(len(rows))
+        values.fill(np.nan)
+        values[rows >= 0]=self.ic[rows[rows >= 0]]
+
+        return values
+
+    def means(self, allGO):
+        """
+        Return the list of the mean information contents of a list of sets of GO ids, nan for empty sets
+        """
+        allGO=[list(GO) for GO in allGO]
+        sizes=np.array([len(GO) for GO in allGO], dtype=np.int64)
+        values=self._values([go for GO in allGO for go in GO])
+
+        means=np.empty(len(allGO))
+        means.fill(np.nan)
+        nonEmpty=sizes > 0
+        if nonEmpty.any():
+            starts=(np.cumsum(sizes)-sizes)[nonEmpty]
+            means[nonEmpty]=np.add.reduceat(values, starts)/sizes[nonEmpty]
+
+        return means.tolist()
+
+    def maximum(self, intids):
+        """
+        Return the largest information content of a set of terms (in int format)
+        """
+        row=self.csr.row
+        return self.ic[[row[intid] for intid in intids]].max()
+
+    def micaTable(self, maxSize=1000000):
+        """
+        Return the MICATable of this information content, created on first use
+        """
+        if self.__dict__.get('mica') is None:
+            self.mica=MICATable(self, maxSize)
+
+        return self.mica
+
+
+class MICATable(object):
+    """
+    Information content of the most informative common ancestor (MICA) of pairs of GO terms, as used by Resnik.
+    The values are kept in a cache of about maxSize pairs of terms, the missing pairs are computed together
+    in one pass over the ancestor closure. The cache evicts the least recently used pairs by generations:
+    once the current generation holds maxSize/2 pairs it replaces the previous one, pairs of the previous
+    generation that are used again are moved to the current one.
+    """
+
+    def __init__(self, table, maxSize=1000000):
+        self.table=table
+        self.maxSize=maxSize
+        self.recent, self.older = dict(), dict()
+
+    def __len__(self):
+        return len(self.recent) + len(self.older)
+
+    def rows(self, intids):
+        """
+        Return the rows of a list of terms (in int format) once mapped to their alternative, -1 if not in the graph
+        """
+        G, row = self.table.G, self.table.csr.row
+        return [row.get(G.GOAlt.get(intid, intid), -1) for intid in intids]
+
+    def lookup(self, rows1, rows2):
+        """
+        Return the list of the information contents of the MICA of the pairs of rows (rows1[p], rows2[p]),
+        -inf if the terms have no common ancestor
+        """
+        width=len(self.table.csr)
+        recent, older = self.recent, self.older
+
+        keys=[min(r1, r2)*width + max(r1, r2) if r1 >= 0 and r2 >= 0 else -1 for r1, r2 in zip(rows1, rows2)]
+
+        values=list()
+        missing=set()
+        for k in keys:
+            v=recent.get(k)
+            if v is None:
+                v=older.get(k)
+                if v is not None:
+                    recent[k]=v
+                elif k >= 0:
+                    missing.add(k)
+            values.append(v)
+
+        if len(missing) > 0:
+            new=np.array(sorted(missing), dtype=np.int64)
+            computed=dict(zip(new.tolist(), self._compute(new // width, new % width).tolist()))
+            recent.update(computed)
+            values=[v if v is not None else computed.get(k, -np.inf) for k, v in zip(keys, values)]
+        elif None in values:
+            values=[v if v is not None else -np.inf for v in values]
+
+        if len(recent) > self.maxSize/2:
+            self.recent, self.older = dict(), recent
+
+        return values
+
+    def _compute(self, rows1, rows2):
+        pair, ancestor = self.table.csr.commonAncestors(rows1, rows2)
+
+        mica=np.empty(len(rows1))
+        mica.fill(-np.inf)
+        np.maximum.at(mica, pair, self.table.ic[ancestor])
+
+        return mica
+
+    def preload(self, allGO1, allGO2):
+        """
+        Compute the MICA of all the pairs of terms of the annotation sets allGO1[i] and allGO2[i] (GO ids), e.g. the
+        annotations of the same gene products in two FuncAnnot, or twice the same list for the pairs within each set.
+        The pairs are looked up in chunks of at most maxSize/2 pairs, the size of a generation of the cache, so that
+        the cache stays bounded: with more pairs than that, the first ones are evicted by the last ones.
+        """
+        G=self.table.G
+        chunkSize=max(self.maxSize/2, 1)
+        rows1, rows2 = list(), list()
+        for GO1, GO2 in zip(allGO1, allGO2):
+            r1, r2 = self.rows(G.GOtoInt(GO1)), self.rows(G.GOtoInt(GO2))
+            rows1.extend([r for r in r1 for i in r2])
+            rows2.extend(r2*len(r1))
+
+            if len(rows1) >= chunkSize:
+                self.lookup(rows1, rows2)
+                rows1, rows2 = list(), list()
+
+        if len(rows1) > 0:
+            self.lookup(rows1, rows2)
+
+    def similarity(self, GO1, GO2):
+        """
+        Resnik similarity between two sets of annotations (in int format): the mean, over the terms of each set,
+        of the best MICA with the terms of the other set. Returns the similarity and the two means.
+        """
+        r1, r2 = self.rows(GO1), self.rows(GO2)
+        if len(r1)==0 or len(r2)==0:
+            return np.nan, [np.nan, np.nan]
+
+        values=self.lookup([r for r in r1 for i in r2], r2*len(r1))
+        D=[values[i*len(r2):(i+1)*len(r2)] for i in range(len(r1))]
+
+        M1=sum([max(d) for d in D])/len(r1)
+        M2=sum([max(d) for d in zip(*D)])/len(r2)
+
+        return (M1+M2)/2.0, [M1,M2]
+
+
+class _AspectIC(object):
+    """
+    Dictionary-like access to the information content of the terms of one aspect, keyed by int id
+    """
+
+    def __init__(self, table, aspect):
+        self.table=table
+        self.aspect=aspect
+
+    def _row(self, intid):
+        r=self.table.csr.row.get(intid, -1)
+        if r < 0 or self.table.aspect[r]!=self.aspect or np.isnan(self.table.ic[r]):
+            return -1
+        return r
+
+    def __getitem__(self, intid):
+        r=self._row(intid)
+        if r < 0:
+            raise KeyError(intid)
+        return self.table.ic[r]
+
+    def has_key(self, intid):
+        return self._row(intid) >= 0
+
+    __contains__=has_key
+
+    def get(self, intid, default=None):
+        r=self._row(intid)
+        if r < 0:
+            return default
+        return self.table.ic[r]
+
+
+def fromFA(allFA):
+    """
+    Compute the information content of the GO terms from the annotations of a list of FuncAnnot sharing
+    the same graph. The number of annotations of each term is propagated to its ancestors by a sparse
+    product with the ancestor closure.
+    """
+    G=allFA[0].G
+    csr=G.get_CSR()
+    closure_indptr, closure_indices = csr.get_closure()
+
+    #Number of annotations of each term
+    direct=np.zeros(len(csr))
+    for FA in allFA:
+        for a in G.aspect:
+            terms, counts = FA.termTable(a)[:2]
+            rows=np.array([csr.row.get(intid, -1) for intid in G.GOtoInt(terms)], dtype=np.int64)
+            valid=rows >= 0
+            direct+=np.bincount(rows[valid], weights=counts[valid], minlength=len(csr))
+
+    #Number of annotations of each term or its descendants
+    rows=np.flatnonzero(direct)
+    sizes=closure_indptr[rows+1]-closure_indptr[rows]
+    position=np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes)-sizes, sizes) + np.repeat(closure_indptr[rows], sizes)
+    counts=np.bincount(closure_indices[position], weights=np.repeat(direct[rows], sizes), minlength=len(csr))
+
+    return ICTable(G, counts)
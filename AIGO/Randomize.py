@@ -22,13 +22,25 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pylab import *
+from numpy import *
 
-from random import shuffle
-from itertools import groupby, repeat
+import os
+import multiprocessing
+
+import numpy as np
 
 from AIGO import logger, logFun
-from AIGO import allAspect
+from AIGO.FunctionalAnnotation import FuncAnnot
+from AIGO.AnnotationStore import AnnotationStore
+from AIGO.Analyse import AnalyseFA
+from AIGO.utils.Logger import LogProgress
+
+#Arguments of the current parallel permutation test, inherited by the forked workers
+_test = None
+
+#Smallest number of replicates per worker for a permutation test to use a pool of processes:
+#below, starting the pool costs more than it saves and the replicates are computed serially
+MIN_REPLICATES_PER_WORKER = 25
 
 class RandomizeFA(dict):
     """
@@ -54,25 +66,7 @@ class RandomizeFA(dict):
 
             logger.info("\t%s" % (FA.name))
 
-            for aspect in allAspect:
-                if aspect=='All_aspects_of_GO':
-                    continue
-
-                iterKeys=flatten([list(repeat(k,len(FA.GPtoGO[aspect][k]))) for k in FA.GPtoGO[aspect].keys()])
-                iterValues=list(flatten(FA.GPtoGO[aspect].values()))
-                shuffle(iterValues)
-
-                GPtoGO, GOtoGP=dict(), dict()
-                for k,v in groupby(iterValues, lambda x: iterKeys.next()):
-                    GPtoGO[k]= set(v)
-
-                    for go in GPtoGO[k]:
-                        if not GOtoGP.has_key(go):
-                            GOtoGP[go]=set()
-                        GOtoGP[go].add(k)
-
-                FA.GPtoGO[aspect]=GPtoGO
-                FA.GOtoGP[aspect]=GOtoGP
+            _replace(FA, shuffledStore(FA.annotationStore()))
 
     @logFun("Computing resampling of functional annotations")
     def sampleAnnotation(self, allFA):
@@ -84,23 +78,209 @@ class RandomizeFA(dict):
 
             logger.info("\t%s" % (FA.name))
 
-            for aspect in allAspect:
-                if aspect=='All_aspects_of_GO':
-                    continue
-                
-                iterKeys=flatten([list(repeat(k,len(FA.GPtoGO[aspect][k]))) for k in FA.GPtoGO[aspect].keys()])
-                nbValues=len(list(flatten(FA.GPtoGO[aspect].values())))
-                allNodes=FA.G.get_NodesfromAspect(aspect)
-                iterValues=take(allNodes, randint(0,len(allNodes), nbValues))
-
-                GPtoGO, GOtoGP=dict(), dict()
-                for k,v in groupby(iterValues, lambda x: iterKeys.next()):
-                    GPtoGO[k]= set(v)
-
-                    for go in GPtoGO[k]:
-                        if not GOtoGP.has_key(go):
-                            GOtoGP[go]=set()
-                        GOtoGP[go].add(k)
-
-                FA.GPtoGO[aspect]=GPtoGO
-                FA.GOtoGP[aspect]=GOtoGP
+            _replace(FA, sampledStore(FA.annotationStore(), FA.G))
+
+    @logFun("Computing permutation test of functional annotations")
+    def permutationTest(self, allFA, statistics, method="shuffle", replicates=1000, seed=0, alternative="two-sided", workers=None):
+        """
+        Compare AnalyseFA statistics of each FA with their null distribution over randomized replicates of the FA,
+        generated as shuffleAnnotation or sampleAnnotation (method "shuffle" or "sample") would, but without modifying the FA.
+        Each replicate has its own seed drawn from seed, the results do not depend on the number of workers.
+        With workers=N (N>1), the replicates are computed by a pool of N forked processes, provided that there are
+        at least MIN_REPLICATES_PER_WORKER replicates per process (serially otherwise).
+        Statistics are summarized for each aspect by their value, or their mean for lists of values.
+        Return, and store in self['permutationTest'], a dictionary FA name -> statistics -> aspect -> dictionary with
+            observed - the value of the FA
+            null     - the array of the values of the replicates
+            pvalue   - the empirical p-value, (1 + number of replicates at least as extreme) / (1 + replicates),
+                       for the alternative "greater", "less" or "two-sided"
+        """
+        global _test
+
+        if method not in ["shuffle", "sample"]:
+            logger.handleWarning("Sorry, unknown randomization %s " % method)
+            return None
+
+        analyseFA=AnalyseFA()
+        for FA in allFA:
+            for stat in statistics:
+                if not FA.has_key(stat):
+                    getattr(analyseFA, stat)([FA])
+
+        if workers > 1 and len(allFA)*replicates < MIN_REPLICATES_PER_WORKER*workers:
+            workers=None
+
+        #The seeds of the replicates of each FA, split in units of work
+        seeds=np.random.RandomState(seed).randint(0, 2**31-1, size=(len(allFA), replicates))
+        chunkSize=max(1, replicates/(4*max(workers, 1)))
+        units=[(i, seeds[i, c:c+chunkSize].tolist()) for i in range(len(allFA)) for c in range(0, replicates, chunkSize)]
+
+        progress=LogProgress(len(allFA)*replicates)
+        _test=(allFA, statistics, method)
+        try:
+            if workers > 1 and hasattr(os, "fork"):
+                pool=multiprocessing.Pool(workers)
+                try:
+                    results=list()
+                    for r in pool.imap(_replicates, units):
+                        results.append(r)
+                        progress.update(len(r[1]))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results=list()
+                for unit in units:
+                    results.append(_replicates(unit))
+                    progress.update(len(unit[1]))
+        finally:
+            _test=None
+            progress.finished()
+
+        test=dict()
+        for i, FA in enumerate(allFA):
+            values=[v for j, v in results if j==i]
+            test[FA.name]=dict()
+            for stat in statistics:
+                test[FA.name][stat]=dict()
+                for aspect in FA[stat]:
+                    null=np.concatenate([v[stat][aspect] for v in values])
+                    observed=_summary(FA[stat][aspect])
+                    test[FA.name][stat][aspect]={"observed": observed, "null": null, "pvalue": empiricalPValue(observed, null, alternative)}
+
+        self['permutationTest']=test
+
+        return test
+
+
+def shuffledStore(store, rng=np.random):
+    """
+    Return the AnnotationStore obtained by shuffling, with the permutation of rng, the GO terms of each aspect
+    across its annotation sets. A term drawn twice by the same set is kept once.
+    """
+    term=store.term.copy()
+    bounds=np.searchsorted(store.aspect, np.arange(len(store.aspects)+1))
+    for a in range(len(store.aspects)):
+        term[bounds[a]:bounds[a+1]]=term[bounds[a]:bounds[a+1]][rng.permutation(bounds[a+1]-bounds[a])]
+
+    return _uniqueStore(store.genes, store.terms, store.gene, term, store.aspect, store.aspects)
+
+
+def sampledStore(store, G, rng=np.random):
+    """
+    Return the AnnotationStore obtained by drawing, with the randint of rng, the GO terms of the annotation sets
+    of each aspect among the terms of this aspect in G. A term drawn twice by the same set is kept once.
+    """
+    terms=list()
+    term=np.empty(len(store.term), dtype=np.int32)
+    bounds=np.searchsorted(store.aspect, np.arange(len(store.aspects)+1))
+    for a, aspect in enumerate(store.aspects):
+        nodes=G.get_NodesfromAspect(aspect)
+        term[bounds[a]:bounds[a+1]]=len(terms) + rng.randint(0, len(nodes), bounds[a+1]-bounds[a])
+        terms.extend(nodes)
+
+    return _uniqueStore(store.genes, terms, store.gene, term, store.aspect, store.aspects)
+
+
+def _uniqueStore(genes, terms, gene, term, aspect, aspects):
+    #Drop the duplicated annotations, the annotations are sorted by aspect, gene and term
+    key=np.unique((aspect.astype(np.int64)*len(genes) + gene)*len(terms) + term)
+    term=(key % len(terms)).astype(np.int32)
+    key=key // len(terms)
+
+    return AnnotationStore(genes, terms, (key % len(genes)).astype(np.int32), term, (key // len(genes)).astype(np.int8), aspects)
+
+
+def _replace(FA, store):
+    #Replace the annotations of FA, as dictionaries unless FA is columnar, the change goes through FA.changed
+    before, after = _triples(FA.annotationStore()), _triples(store)
+
+    FA.store=store
+    FA.compact()
+    if not FA.isColumnar():
+        FA.expand()
+
+    FA.changed(list(after.difference(before)), list(before.difference(after)))
+
+
+def _triples(store):
+    #The set of (gene product, GO term, aspect) triples of an AnnotationStore
+    genes, terms, aspects = store.genes, store.terms, store.aspects
+    return set([(genes[g], terms[t], aspects[a]) for g, t, a in zip(store.gene.tolist(), store.term.tolist(), store.aspect.tolist())])
+
+
+def randomizedFA(FA, method="shuffle", seed=None):
+    """
+    Return a new columnar FuncAnnot holding a randomized replicate of the annotations of FA, shuffled or sampled
+    (method "shuffle" or "sample") with a random generator seeded with seed. The annotations of FA are not modified.
+    """
+    new=FuncAnnot(FA.name, FA.refSet, FA.G, columnar=True)
+    if FA.__dict__.has_key('organism'):
+        new.organism=FA.organism
+
+    rng=np.random.RandomState(seed)
+    if method=="shuffle":
+        new.store=shuffledStore(FA.annotationStore(), rng)
+    else:
+        new.store=sampledStore(FA.annotationStore(), FA.G, rng)
+    new.compact()
+
+    new['GA']=set([new.store.genes[g] for g in np.unique(new.store.gene).tolist()])
+    new.status="Loaded"
+
+    return new
+
+
+def empiricalPValue(observed, null, alternative="two-sided"):
+    """
+    Empirical p-value of an observed value given the values of a null distribution, nan values are ignored
+    """
+    null=np.asarray(null, dtype=float)
+    null=null[~np.isnan(null)]
+    if np.isnan(observed):
+        return nan
+
+    greater=(1. + (null >= observed).sum()) / (1. + len(null))
+    less=(1. + (null <= observed).sum()) / (1. + len(null))
+
+    if alternative=="greater":
+        return greater
+    elif alternative=="less":
+        return less
+
+    return min(1., 2*min(greater, less))
+
+
+def _summary(value):
+    if type(value)==list:
+        return mean(value)
+    return float(value)
+
+
+def _replicates(unit):
+    """
+    Compute the statistics of the replicates of the i-th FA generated from the given seeds, return i and,
+    for each statistics and aspect, the array of the values of the replicates
+    """
+    allFA, statistics, method = _test
+    i, seeds = unit
+    FA=allFA[i]
+
+    analyseFA=AnalyseFA()
+    values=dict([(stat, dict()) for stat in statistics])
+
+    #The info messages of the statistics are withheld
+    logger.withholdInfo()
+    try:
+        for r, s in enumerate(seeds):
+            replicate=randomizedFA(FA, method, s)
+            for stat in statistics:
+                getattr(analyseFA, stat)([replicate])
+                for aspect in replicate[stat]:
+                    if not values[stat].has_key(aspect):
+                        values[stat][aspect]=np.empty(len(seeds))
+                    values[stat][aspect][r]=_summary(replicate[stat][aspect])
+    finally:
+        logger.releaseInfo()
+
+    return i, values
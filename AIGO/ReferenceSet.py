@@ -23,16 +23,25 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pylab import *
+from numpy import *
 
 import os,csv
+import json
+import shutil
 
 from AIGO import logger, logFun
-from AIGO.utils.File  import checkForZip, readFile
+from AIGO.utils.File  import checkForZip, readFile, readFastaHeaders
+from AIGO.go.Cache import CACHE_VERSION, fileSignature, isValidCache
 
 
 class RefSet(set):
 
+    """
+    Set of the gene products of an organism, read from FASTA, text, GAF or Affymetrix annotation files.
+    With cache=True, the ids read from a file are saved in <fileName>.<refType>.cache and read from there
+    as long as the file does not change.
+    """
+
     def __init__(self,  *args, **kargs):
 
         self.update(*args)
@@ -45,10 +54,10 @@ class RefSet(set):
         refType  = kargs.get('refType', 'Fasta')
 
         if not fileName == '':        
-            self.add(fileName, refType)
+            self.add(fileName, refType, cache=kargs.get('cache', False))
 
     @logFun("Creating reference set")
-    def add(self, fileName, refType="Fasta"):
+    def add(self, fileName, refType="Fasta", cache=False):
 
         if self.fileName=='':
             self.fileName=fileName
@@ -61,6 +70,8 @@ class RefSet(set):
                 self.fileName=[self.fileName,fileName]
                 self.refType=[self.refType,refType]
 
+        cacheName="%s.%s.cache" % (fileName, refType)
+
         fileName= checkForZip(fileName)
         if (not os.path.exists(fileName)):
             logger.handleFatal(fileName+" does not exist and is required ")
@@ -69,12 +80,21 @@ class RefSet(set):
         
         logger.info("%s file :\t%s " % (refType, fileName ) )
 
+        if cache:
+            logger.info("Reading cached reference set : %s" % cacheName)
+            allID=loadIds(cacheName, fileName)
+            if allID is not None:
+                self.update(allID)
+                if len(self)==0:
+                    logger.handleWarning("No gene products loaded")
+                return
+            logger.info("No valid cache found")
+
         try:
             
-            #Use fasta file to define the reference set
+            #Use fasta file to define the reference set, only the headers are read
             if refType=="Fasta":
-                from Bio import SeqIO
-                allID=set([rec.name.split(";")[0].split(":")[-1] for rec in SeqIO.parse(readFile(fileName), "fasta")])
+                allID=set([fastaId(title) for title in readFastaHeaders(readFile(fileName))])
                 self.update(allID)
 
             #Use a simple text file to define the reference set, first column is chosen by default
@@ -118,5 +138,55 @@ class RefSet(set):
         except Exception, e:
             logger.handleFatal("Unable to read file %s: %s" % (fileName, str(e)))
 
+        if cache:
+            try:
+                logger.info("Saving cached reference set")
+                saveIds(allID, cacheName, fileName)
+            except (IOError, OSError), e:
+                logger.handleWarning("Unable to save cache %s: %s" % (cacheName, str(e)))
+
+
+def fastaId(title):
+    """
+    Return the gene product id of a FASTA header: the first word, without the text before the last ':' and after the first ';'
+    """
+    words=title.split(None, 1)
+    if len(words)==0:
+        return ""
+
+    return words[0].split(";")[0].split(":")[-1]
+
+
+def saveIds(allID, cacheDir, source):
+    """
+    Save the ids read from the file source in the cache directory cacheDir
+    """
+    tmpDir="%s.%d.tmp" % (cacheDir, os.getpid())
+    if os.path.exists(tmpDir):
+        shutil.rmtree(tmpDir)
+    os.makedirs(tmpDir)
+
+    with open(os.path.join(tmpDir, "ids.txt"), "wb") as f:
+        f.write("".join(["%s\n" % gp for gp in sorted(allID)]))
+
+    with open(os.path.join(tmpDir, "header.json"), "w") as f:
+        json.dump({"version": CACHE_VERSION, "source": fileSignature(source)}, f)
+
+    if os.path.exists(cacheDir):
+        shutil.rmtree(cacheDir)
+    os.rename(tmpDir, cacheDir)
+
+
+def loadIds(cacheDir, source):
+    """
+    Load the ids saved in the cache directory cacheDir.
+    None is returned if the cache is missing or out of date with respect to the file source.
+    """
+    if not isValidCache(cacheDir, source):
+        return None
+
+    with open(os.path.join(cacheDir, "ids.txt"), "rb") as f:
+        return set(f.read().splitlines())
+
 
 
@@ -1,4 +1,4 @@
-from pylab import *
+from numpy import *
 
 from time import strftime
 
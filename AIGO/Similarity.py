@@ -22,7 +22,12 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import math
+
+import numpy as np
+
 from AIGO import logger
+from AIGO.InformationContent import ICTable
 
 def GOSet_Similarity(G, GO, metric="GS2", **kargs):
     """
@@ -45,6 +50,115 @@ def GOSet_Similarity(G, GO, metric="GS2", **kargs):
     return allD 
     
 
+def GOSet_BatchSimilarity(G, GPtoGO, metric="GS2", chunkSize=100000, **kargs):
+    """
+    Calculates pairwise semantic similarity scores between GO terms in all the annotation sets of a mapping
+    (e.g. FA.GPtoGO[aspect]) at once. Returns the list of gene products and two arrays: offsets and allD,
+    where allD[offsets[i]:offsets[i+1]] are the scores that GOSet_Similarity gives for the i-th gene product.
+    The term pairs are processed by chunks of chunkSize pairs.
+    """
+
+    if metric not in ["GS2", "CzekanowskiDice", "Resnik"]:
+        logger.handleWarning ("Sorry, unknown semnatic similarity %s " % metric)
+        return None, None, None
+
+    csr=G.get_CSR()
+
+    #Enumerate the term pairs of each annotation set in the order used by GOSet_Similarity
+    genes=list(GPtoGO)
+    nbPairs=np.zeros(len(genes), dtype=np.int64)
+    allRows1, allRows2 = list(), list()
+    for k, gp in enumerate(genes):
+        GO=GPtoGO[gp]
+        if len(GO)<2:
+            continue
+
+        if metric=="Resnik":
+            GO=[G.get_goid(G.GOAlt.get(intid, intid)) for intid in G.GOtoInt(GO)]
+        rows=np.array([csr.row.get(intid, -1) for intid in G.GOtoInt(GO)], dtype=np.int64)
+        i, j = np.triu_indices(len(rows), 1)
+        allRows1.append(rows[i])
+        allRows2.append(rows[j])
+        nbPairs[k]=len(i)
+
+    #Annotation sets with less than two terms have a similarity of 1
+    offsets=np.zeros(len(genes)+1, dtype=np.int64)
+    offsets[1:]=np.cumsum(np.maximum(nbPairs, 1))
+    allD=np.ones(offsets[-1])
+
+    if len(allRows1) > 0:
+        rows1, rows2 = np.concatenate(allRows1), np.concatenate(allRows2)
+
+        IC=None
+        if metric=="Resnik":
+            IC=_rowIC(G, csr, kargs.get('IC', dict()))
+
+        D=np.concatenate([_pairSimilarity(csr, rows1[c:c+chunkSize], rows2[c:c+chunkSize], metric, IC)
+                          for c in xrange(0, len(rows1), chunkSize)])
+
+        paired=np.repeat(nbPairs > 0, np.maximum(nbPairs, 1))
+        allD[paired]=D
+
+    return genes, offsets, allD
+
+def _rowIC(G, csr, IC):
+    """
+    Information content of the terms of the CSR view, nan if unknown
+    """
+    if isinstance(IC, ICTable) and IC.csr is csr:
+        return IC.ic
+
+    ic=np.empty(len(csr))
+    ic.fill(np.nan)
+    for r, intid in enumerate(csr.terms.tolist()):
+        aspectIC=IC.get(G.GONameSpace.get(intid), dict())
+        if aspectIC.has_key(intid):
+            ic[r]=aspectIC[intid]
+
+    return ic
+
+def _gatherKeys(indptr, indices, sel, width):
+    """
+    Return, for each position p of sel, the elements e of the set indices[indptr[sel[p]]:indptr[sel[p]+1]]
+    (empty if sel[p] is negative) encoded as p*width+e, and the size of the sets
+    """
+    valid=sel >= 0
+    start=np.where(valid, indptr[np.where(valid, sel, 0)], 0)
+    counts=np.where(valid, indptr[np.where(valid, sel, 0)+1]-start, 0)
+
+    pair=np.repeat(np.arange(len(sel), dtype=np.int64), counts)
+    position=np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts) + np.repeat(start, counts)
+
+    return pair*width + indices[position], counts
+
+def _pairSimilarity(csr, rows1, rows2, metric, IC=None):
+    """
+    Vectorized semantic similarity between the terms rows1[p] and rows2[p] of the CSR view
+    """
+    indptr, indices = csr.get_closure()
+    keys1, n1 = _gatherKeys(indptr, indices, rows1, len(csr))
+    keys2, n2 = _gatherKeys(indptr, indices, rows2, len(csr))
+
+    #Common ancestors of each pair
+    common=np.intersect1d(keys1, keys2, assume_unique=True)
+    pair=common // len(csr)
+    I=np.bincount(pair, minlength=len(rows1)).astype(float)
+
+    if metric=="GS2":
+        s1=np.where(n1 > 0, I/np.maximum(n1, 1), 0.)
+        s2=np.where(n2 > 0, I/np.maximum(n2, 1), 0.)
+        return (s1+s2)/2
+
+    elif metric=="CzekanowskiDice":
+        U=n1+n2-I
+        return 1.- (U-I)/(U+I)
+
+    elif metric=="Resnik":
+        D=np.empty(len(rows1))
+        D.fill(-np.inf)
+        np.maximum.at(D, pair, IC[common % len(csr)])
+        return D
+
 def GOSet_PWSimilarity(G, GO1, GO2, metric="GS2", **kargs):
     """
     Calculates pairwise semantic similarity scores between two given annotation sets
@@ -63,9 +177,140 @@ def GOSet_PWSimilarity(G, GO1, GO2, metric="GS2", **kargs):
     
     return sim, l
 
-def GO_Similarity(G, allGO, metric="GS2", **kargs):
+def GOSet_BatchPWSimilarity(G, GPtoGO1, GPtoGO2, genes, metric="GS2", chunkSize=5000, blockSize=250000, **kargs):
+    """
+    Calculates the pairwise semantic similarity scores between the annotation sets GPtoGO1[g] and GPtoGO2[g] of
+    many gene products g at once (e.g. the genes commonly annotated by two FA). Returns the two lists l1 and l2,
+    where (l1[i], l2[i]) is the list l that GOSet_PWSimilarity gives for genes[i].
+    For GS2 and CzekanowskiDice the gene products are processed by chunks of chunkSize with the ancestor closure,
+    for Resnik with an ICTable all the term pairs are loaded at once in its MICA table.
+    """
+
+    if metric not in ["GS2", "CzekanowskiDice", "Resnik"]:
+        logger.handleWarning ("Sorry, unknown semnatic similarity %s " % metric)
+        return None, None
+
+    genes=list(genes)
+
+    if metric=="Resnik":
+        IC=kargs.get('IC', dict())
+        allGO1=[G.GOtoInt(GPtoGO1[g]) for g in genes]
+        allGO2=[G.GOtoInt(GPtoGO2[g]) for g in genes]
+        if isinstance(IC, ICTable):
+            IC.micaTable().preload([G.InttoGO(GO) for GO in allGO1], [G.InttoGO(GO) for GO in allGO2])
+        l=[G.Resnik(GO1, GO2, IC)[1] for GO1, GO2 in zip(allGO1, allGO2)]
+        return [m[0] for m in l], [m[1] for m in l]
+
+    csr=G.get_CSR()
+    l1, l2 = list(), list()
+    for c in xrange(0, len(genes), chunkSize):
+        chunk=genes[c:c+chunkSize]
+        n=len(chunk)
+
+        #The sets of GPtoGO1 then those of GPtoGO2: set i is compared to set i+n
+        indptr, rows = _annotationSets(G, csr, [GPtoGO1[g] for g in chunk] + [GPtoGO2[g] for g in chunk])
+        I, J = np.arange(n), np.arange(n, 2*n)
+
+        if metric=="GS2":
+            s=_gs2SetPairs(csr, indptr, rows, np.r_[J, I])
+            l1.extend(s[:n].tolist())
+            l2.extend(s[n:].tolist())
+        else:
+            induced, terms = _inducedSets(csr, indptr, rows)
+            s=_diceSetPairs(csr, induced, terms, I, J, blockSize).tolist()
+            l1.extend(s)
+            l2.extend(s)
+
+    return l1, l2
+
+def GOSet_BatchOverlap(G, GPtoGO1, GPtoGO2, genes, chunkSize=5000):
+    """
+    Calculates the hierarchical overlap between the annotation sets GPtoGO1[g] and GPtoGO2[g] of many gene products g
+    at once. For each pair of terms, the number of their common ancestors is divided by the number of ancestors of
+    either term, the best ratio of each term with the terms of the other set is then averaged over the set.
+    Returns the two lists of the averages of the sets of GPtoGO1 and of GPtoGO2, in the order of genes, e.g. the
+    hierarchical precision and recall of Verspoor et al. (2006) when GPtoGO2 is a gold standard.
+    Terms not in the graph have a nan ratio.
+    """
+    csr=G.get_CSR()
+    cindptr=csr.get_closure()[0]
+
+    genes=list(genes)
+    l1, l2 = list(), list()
+    for c in xrange(0, len(genes), chunkSize):
+        chunk=genes[c:c+chunkSize]
+        indptr1, rows1 = _annotationSets(G, csr, [GPtoGO1[g] for g in chunk])
+        indptr2, rows2 = _annotationSets(G, csr, [GPtoGO2[g] for g in chunk])
+        a, b = np.diff(indptr1), np.diff(indptr2)
+
+        #All the term pairs of each gene product, term of set 1 major: pair (i, j) of gene k is at start[k]+i*b[k]+j
+        nbPairs=a*b
+        start=np.cumsum(nbPairs)-nbPairs
+        gene=np.repeat(np.arange(len(chunk), dtype=np.int64), nbPairs)
+        offset=np.arange(nbPairs.sum()) - start[gene]
+        i, j = offset // np.maximum(b[gene], 1), offset % np.maximum(b[gene], 1)
+        term1, term2 = indptr1[gene]+i, indptr2[gene]+j
+
+        #Number of common ancestors of each pair
+        pair=csr.commonAncestors(rows1[term1], rows2[term2])[0]
+        I=np.bincount(pair, minlength=len(gene)).astype(float)
+
+        l1.extend(_bestOverlap(I, rows1, term1, indptr1, cindptr))
+        order=np.lexsort((term1, term2))
+        l2.extend(_bestOverlap(I[order], rows2, term2[order], indptr2, cindptr))
+
+    return l1, l2
+
+def _bestOverlap(I, rows, term, indptr, cindptr):
+    """
+    Mean over the terms of each set of their best ratio I/number of ancestors, given the pairs sorted by term
+    """
+    size=np.where(rows >= 0, cindptr[np.maximum(rows, 0)+1]-cindptr[np.maximum(rows, 0)], 0)
+
+    best=np.empty(len(rows))
+    best.fill(np.nan)
+    paired=np.unique(term)
+    if len(paired) > 0:
+        first=np.searchsorted(term, paired)
+        best[paired]=np.maximum.reduceat(I, first)
+    best=np.where(size > 0, best/np.maximum(size, 1), np.nan)
+
+    n=len(indptr)-1
+    owner=np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    with np.errstate(invalid="ignore"):
+        return (np.bincount(owner, weights=best, minlength=n) / np.diff(indptr)).tolist()
+
+def _gs2SetPairs(csr, indptr, rows, partner):
+    """
+    GS2 similarity of each annotation set i with the set partner[i]: for each term of i, the fraction of its ancestors
+    found in the set induced by partner[i], averaged over the terms of i (terms not in the graph count as 0)
+    """
+    n=len(indptr)-1
+    width=len(csr)
+    size=np.diff(indptr)
+    owner=np.repeat(np.arange(n, dtype=np.int64), size)
+
+    induced, terms = _inducedSets(csr, indptr, rows)
+    inducedKeys=np.repeat(np.arange(n, dtype=np.int64), np.diff(induced))*width + terms
+
+    cindptr, cindices = csr.get_closure()
+    keys, counts = _gatherKeys(cindptr, cindices, rows, width)
+    term=keys // width
+    keys=partner[owner[term]]*width + keys % width
+
+    #inducedKeys is sorted
+    position=np.minimum(np.searchsorted(inducedKeys, keys), max(len(inducedKeys)-1, 0))
+    found=inducedKeys[position]==keys if len(inducedKeys) > 0 else np.zeros(len(keys), dtype=bool)
+    rank=np.bincount(term[found], minlength=len(rows)) / np.maximum(counts, 1.)
+
+    return np.bincount(owner, weights=rank, minlength=n) / np.maximum(size, 1)
+
+def GO_Similarity(G, allGO, metric="GS2", blockSize=250000, **kargs):
     """
     Calculates pairwise semantic similarity scores in a list of annotation sets
+    For GS2, the counts of G.GS2Counts(allGO) can be given as inducedCounts.
+    For CzekanowskiDice and Resnik, all the pairs of annotation sets are compared, by blocks of about
+    blockSize elements so that the memory used is bounded.
     """
     
     if len(allGO)<2:
@@ -73,31 +318,277 @@ def GO_Similarity(G, allGO, metric="GS2", **kargs):
         l=[1.0]
     else:
         if metric=="GS2":
-            sim,l=G.GS2( [G.GOtoInt(GO)  for GO in allGO ])
+            sim,l=G.GS2( [G.GOtoInt(GO)  for GO in allGO ], kargs.get('inducedCounts'))
         elif metric=="CzekanowskiDice":
-            allGO=[G.GOtoInt(GO)  for GO in allGO ]
-
-            allD=dict()
-            l=list()
-            for i,GO1 in enumerate(allGO):
-                foo=[allD.setdefault(sort([i,j])[0],dict()).setdefault(sort([i,j])[1], G.CzekanowskiDice(GO1, GO2)) for j,GO2 in enumerate(allGO) if not j==i]
-                l.append(mean(foo))
+            csr=G.get_CSR()
+            indptr, rows = _annotationSets(G, csr, allGO)
 
-            sim=mean(l)
+            l=_diceSimilarity(csr, indptr, rows, blockSize).tolist()
+            sim=np.mean(l)
 
         elif metric=="Resnik":
-            allGO=[G.GOtoInt(GO)  for GO in allGO ]
+            csr=G.get_CSR()
+            indptr, rows = _annotationSets(G, csr, allGO, alternative=True)
 
-            allD=dict()
-            l=list()
-            for i,GO1 in enumerate(allGO):
-                foo=[allD.setdefault(sort([i,j])[0],dict()).setdefault(sort([i,j])[1], G.Resnik(GO1, GO2, kargs.get('IC', dict()))) for j,GO2 in enumerate(allGO) if not j==i]
-                l.append(mean(foo))
-
-            sim=mean(l)
+            l=_resnikSimilarity(csr, indptr, rows, _rowIC(G, csr, kargs.get('IC', dict())), blockSize).tolist()
+            sim=np.mean(l)
             
         else:
             logger.handleWarning ("Sorry, unknown semnatic similarity %s " % metric)
             sim,l=None,None
     
     return sim,l
+
+def GO_SampledSimilarity(G, allGO, metric="GS2", error=0.01, confidence=0.95, pilotSize=50, blockSize=250000, **kargs):
+    """
+    Estimates the pairwise semantic similarity scores in a list of annotation sets
+    Each annotation set is compared to a random sample (with replacement) of the other sets. A pilot sample of
+    pilotSize sets is used to choose the sample size for which the confidence interval of sim has a half width
+    below error. Returns sim, l and the confidence interval (low, high) of sim.
+    GS2 is computed exactly, as are small lists for which sampling would not save any comparison.
+    """
+
+    if metric not in ["GS2", "CzekanowskiDice", "Resnik"]:
+        logger.handleWarning ("Sorry, unknown semnatic similarity %s " % metric)
+        return None, None, None
+
+    n=len(allGO)
+    if metric=="GS2" or n-1 <= pilotSize:
+        sim,l=GO_Similarity(G, allGO, metric, blockSize, **kargs)
+        return sim, l, (sim, sim)
+
+    csr=G.get_CSR()
+    if metric=="CzekanowskiDice":
+        indptr, rows = _inducedSets(csr, *_annotationSets(G, csr, allGO))
+        pairSimilarity=lambda I, J: _diceSetPairs(csr, indptr, rows, I, J, blockSize)
+    else:
+        indptr, rows = _annotationSets(G, csr, allGO, alternative=True)
+        ic=_rowIC(G, csr, kargs.get('IC', dict()))
+        pairSimilarity=lambda I, J: _resnikSetPairs(csr, indptr, rows, ic, I, J, blockSize)
+
+    def sample(k):
+        I=np.repeat(np.arange(n), k)
+        J=np.random.randint(0, n-1, len(I))
+        J=J + (J >= I)
+        return pairSimilarity(I, J).reshape(n, k)
+
+    z=_normalQuantile(0.5 + confidence/2.)
+
+    #Pilot sample, then the sample size needed to reach the error bound
+    D=sample(pilotSize)
+    S=D.var(1, ddof=1).sum()
+    k=int(np.ceil(z*z*S/(n*n*error*error)))
+    if k >= n-1:
+        sim,l=GO_Similarity(G, allGO, metric, blockSize, **kargs)
+        return sim, l, (sim, sim)
+
+    if k > pilotSize:
+        D=np.hstack([D, sample(k-pilotSize)])
+
+    l=D.mean(1)
+    sim=l.mean()
+    h=z*np.sqrt(D.var(1, ddof=1).sum()/D.shape[1])/n
+
+    return sim, l.tolist(), (sim-h, sim+h)
+
+def _normalQuantile(p):
+    """
+    Quantile of the standard normal distribution
+    """
+    lo, hi = -10., 10.
+    while hi-lo > 1e-9:
+        x=(lo+hi)/2
+        if 0.5*(1+math.erf(x/math.sqrt(2))) < p:
+            lo=x
+        else:
+            hi=x
+
+    return (lo+hi)/2
+
+def _annotationSets(G, csr, allGO, alternative=False):
+    """
+    Return the (indptr, rows) arrays of the terms of each annotation set, -1 for terms not in the graph.
+    With alternative, terms are first replaced by their alternative.
+    """
+    allGO=list(allGO)
+    counts=[len(GO) for GO in allGO]
+    allTerms=[go for GO in allGO for go in GO]
+
+    #Each distinct term is converted once
+    unique=list(set(allTerms))
+    intids=G.GOtoInt(unique)
+    if alternative:
+        intids=[G.GOAlt.get(intid, intid) for intid in intids]
+    rowOf=dict(zip(unique, [csr.row.get(intid, -1) for intid in intids]))
+
+    indptr=np.zeros(len(allGO)+1, dtype=np.int64)
+    indptr[1:]=np.cumsum(counts)
+
+    return indptr, np.array([rowOf[go] for go in allTerms], dtype=np.int64)
+
+def _inducedSets(csr, indptr, rows):
+    """
+    Return the (indptr, rows) arrays of the sets induced by annotation sets, i.e. the union of the ancestors of their terms
+    """
+    n=len(indptr)-1
+    width=len(csr)
+    owner=np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+
+    cindptr, cindices = csr.get_closure()
+    keys, counts = _gatherKeys(cindptr, cindices, rows, width)
+    keys=np.unique(owner[keys // width]*width + keys % width)
+
+    induced=np.zeros(n+1, dtype=np.int64)
+    induced[1:]=np.cumsum(np.bincount(keys // width, minlength=n))
+
+    return induced, keys % width
+
+def _diceSimilarity(csr, indptr, rows, blockSize):
+    """
+    Mean CzekanowskiDice similarity of each annotation set with all the other sets.
+    Sets are processed by blocks sharing about blockSize (set, term) occurrences with the other sets.
+    """
+    n=len(indptr)-1
+    width=len(csr)
+    indptr, rows = _inducedSets(csr, indptr, rows)
+    size=np.diff(indptr)
+    owner=np.repeat(np.arange(n, dtype=np.int64), size)
+
+    #Inverted index: the sets containing each term
+    termCount=np.bincount(rows, minlength=width)
+    termIndptr=np.zeros(width+1, dtype=np.int64)
+    termIndptr[1:]=np.cumsum(termCount)
+    termSets=owner[np.argsort(rows, kind="mergesort")]
+
+    cost=np.zeros(n+1)
+    cost[1:]=np.cumsum(np.bincount(owner, weights=termCount[rows], minlength=n))
+
+    l=np.empty(n)
+    g0=0
+    while g0 < n:
+        g1=np.searchsorted(cost, cost[g0]+blockSize, side="right")-1
+        g1=min(max(g1, g0+1), g0+max(1, blockSize//n), n)
+        B=g1-g0
+
+        #Number of shared terms between the sets of the block and all the sets
+        keys, counts = _gatherKeys(termIndptr, termSets, rows[indptr[g0]:indptr[g1]], n)
+        local=owner[indptr[g0]:indptr[g1]][keys // n] - g0
+        I=np.bincount(local*n + keys % n, minlength=B*n).reshape(B, n)
+
+        U=size[g0:g1, np.newaxis] + size[np.newaxis, :] - I
+        D=1.- (1.0 * (U-I) )/ (U+I)
+        D[np.arange(B), np.arange(g0, g1)]=0.
+        l[g0:g1]=D.sum(1)/(n-1)
+
+        g0=g1
+
+    return l
+
+def _diceSetPairs(csr, indptr, rows, I, J, blockSize):
+    """
+    CzekanowskiDice similarity between the induced sets I[p] and J[p]
+    """
+    width=len(csr)
+    chunkSize=max(1, int(blockSize/max(1., np.diff(indptr).mean())))
+
+    D=list()
+    for c in xrange(0, len(I), chunkSize):
+        keys1, n1 = _gatherKeys(indptr, rows, I[c:c+chunkSize], width)
+        keys2, n2 = _gatherKeys(indptr, rows, J[c:c+chunkSize], width)
+        common=np.intersect1d(keys1, keys2, assume_unique=True)
+        inter=np.bincount(common // width, minlength=len(n1))
+
+        U=n1+n2-inter
+        D.append(1.- (1.0 * (U-inter) )/ (U+inter))
+
+    return np.concatenate(D)
+
+def _micaRows(csr, terms, u, ic, chunkSize=100000):
+    """
+    Similarity of Resnik between the terms u and all the terms, as a len(u) x len(terms) matrix
+    """
+    rows1=np.repeat(terms[u], len(terms))
+    rows2=np.tile(terms, len(u))
+
+    M=np.concatenate([_pairSimilarity(csr, rows1[c:c+chunkSize], rows2[c:c+chunkSize], "Resnik", ic)
+                      for c in xrange(0, len(rows1), chunkSize)])
+
+    return M.reshape(len(u), len(terms))
+
+def _resnikSimilarity(csr, indptr, rows, ic, blockSize):
+    """
+    Mean Resnik similarity of each annotation set with all the other sets.
+    The term similarities are computed for blocks of sets, about blockSize at a time.
+    """
+    n=len(indptr)-1
+    size=np.diff(indptr)
+    start=indptr[:-1]
+    terms, annot = np.unique(rows, return_inverse=True)
+
+    l=np.empty(n)
+    g0=0
+    while g0 < n:
+        g1=g0+1
+        while g1 < n and (indptr[g1+1]-indptr[g0])*len(terms) <= blockSize:
+            g1=g1+1
+
+        u=np.unique(annot[indptr[g0]:indptr[g1]])
+        M=_micaRows(csr, terms, u, ic)
+
+        for i in xrange(g0, g1):
+            #Best match of each term of the set i among the terms of each set, and conversely
+            R=M[np.searchsorted(u, annot[indptr[i]:indptr[i+1]])][:, annot]
+            M1=np.maximum.reduceat(R, start, axis=1).mean(0)
+            M2=np.add.reduceat(R.max(0), start)/size
+
+            sim=(M1+M2)/2.0
+            sim[i]=0.
+            l[i]=sim.sum()/(n-1)
+
+        g0=g1
+
+    return l
+
+def _resnikSetPairs(csr, indptr, rows, ic, I, J, blockSize):
+    """
+    Resnik similarity between the annotation sets I[p] and J[p]
+    """
+    size=np.diff(indptr)
+    terms, annot = np.unique(rows, return_inverse=True)
+    nbTerms=len(terms)
+
+    nbPairs=np.zeros(len(I)+1, dtype=np.int64)
+    nbPairs[1:]=np.cumsum(size[I]*size[J])
+
+    D=list()
+    c=0
+    while c < len(I):
+        #Pairs of sets whose term pairs fit in a block
+        c1=max(c+1, np.searchsorted(nbPairs, nbPairs[c]+blockSize, side="right")-1)
+        a, b = size[I[c:c1]], size[J[c:c1]]
+
+        #All the term pairs of each pair of sets, row by row
+        T=a*b
+        pair=np.repeat(np.arange(len(T)), T)
+        within=np.arange(T.sum()) - np.repeat(np.cumsum(T)-T, T)
+        r, k = within // b[pair], within % b[pair]
+        t1=annot[indptr[I[c:c1]][pair] + r]
+        t2=annot[indptr[J[c:c1]][pair] + k]
+
+        keys, inverse = np.unique(t1*nbTerms + t2, return_inverse=True)
+        mica=_pairSimilarity(csr, terms[keys // nbTerms], terms[keys % nbTerms], "Resnik", ic)[inverse]
+
+        #Best match of each term of the first set (rows) and of the second set (columns)
+        length=np.repeat(b, a)
+        best1=np.maximum.reduceat(mica, np.cumsum(length)-length)
+        M1=np.add.reduceat(best1, np.cumsum(a)-a)/a
+
+        order=np.argsort(pair*b.max()*a.max() + k*a.max() + r, kind="mergesort")
+        length=np.repeat(a, b)
+        best2=np.maximum.reduceat(mica[order], np.cumsum(length)-length)
+        M2=np.add.reduceat(best2, np.cumsum(b)-b)/b
+
+        D.append((M1+M2)/2.0)
+        c=c1
+
+    return np.concatenate(D)
@@ -22,7 +22,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from  pylab import *
+from numpy import *
 
 from AIGO import logger, logFun
 
@@ -37,14 +37,35 @@ class RegisterStatistics(list):
         self.name=dict()
         self.unit=dict()
         self.types=dict()
+        self.keys=dict()
+        self.update=dict()
+        self.perAspect=set()
 
-    def add(self, statistics, name, unit="", types=None):
+    def add(self, statistics, name, unit="", types=None, keys=None):
         logger.info("Registering statistics function %s" % statistics)
         
         self.all.append(statistics)
         self.name[statistics]=name
         self.unit[statistics]=unit
         self.types[statistics]=types
+        self.keys[statistics]=keys or [statistics]
+
+    def setUpdate(self, statistics, update):
+        """
+        Register update(FA), called when the annotations of a FA for which the statistics is stored change,
+        once the derived data of the modified aspects are dropped (see FuncAnnot.changed)
+        """
+        self.update[statistics]=update
+
+    def setPerAspect(self, statistics):
+        """
+        Declare that the statistics accepts aspects=[...], the GO aspects to compute, and that its
+        All_aspects_of_GO value is the mean of the means of the aspects (see utils.Execute.parallelExecute)
+        """
+        self.perAspect.add(statistics)
+
+    def isPerAspect(self, statistics):
+        return statistics in self.perAspect
 
     def isRegistered(self, statistics):
         return self.name.has_key(statistics)
@@ -70,6 +91,12 @@ class RegisterStatistics(list):
     def getTypes(self, statistics):
         return self.types[statistics]
 
+    def getKeys(self, statistics):
+        return self.keys[statistics]
+
+    def getUpdate(self, statistics):
+        return self.update.get(statistics)
+
     def hasType(self, statistics, statType):
         return statType in self.types[statistics]
 
@@ -79,7 +106,7 @@ class RegisterStatistics(list):
 
 registerStat=RegisterStatistics()
 
-registerStat.add("obsolete",            "Not used",                  types="Analyse", unit=AIGO_UNIT_PERCENT)
+registerStat.add("obsolete",            "Not used",                  types="Analyse", unit=AIGO_UNIT_PERCENT, keys=["obsolete", "obsTerm"])
 registerStat.add("unconnected",         "Obsolescence",              types="Analyse", unit=AIGO_UNIT_PERCENT)
 registerStat.add("removeUnconnected",   "Remove Obsolete",           types="Analyse", unit=AIGO_UNIT_NONE)
 registerStat.add("redundancy",          "Redundancy",                types="Analyse", unit=AIGO_UNIT_PERCENT)
@@ -88,7 +115,7 @@ registerStat.add("coverage",            "Coverage",                  types="Anal
 registerStat.add("richness",            "Richness",                  types="Analyse", unit=AIGO_UNIT_PERCENT)
 registerStat.add("numberAnnot",         "Number of Annotations",     types="Analyse", unit=AIGO_UNIT_NONE)
 registerStat.add("coherence",           "Coherence",                 types="Analyse", unit=AIGO_UNIT_NONE)
-registerStat.add("compactness",         "Compactness",               types="Analyse", unit=AIGO_UNIT_NONE)
+registerStat.add("compactness",         "Compactness",               types="Analyse", unit=AIGO_UNIT_NONE, keys=["compactness", "compactnessCI"])
 registerStat.add("specificity",         "Specificity",               types="Analyse", unit=AIGO_UNIT_NONE)
 registerStat.add("informationContent",  "Information Content",       types="Analyse", unit=AIGO_UNIT_NONE)
 
@@ -35,12 +35,24 @@ def logFun(msg):
     def wrap(f):  
         @wraps(f)  
         def decorator(*args, **kwargs):  
+            logger.warningSummary()
             logger.info("=================================================")
             logger.info(msg)
             
             value = f(*args, **kwargs)  
             
+            logger.warningSummary()
             logger.info("Done")
             return value  
         return decorator  
     return wrap  
+
+def summarizeWarnings(f):
+    """Log the summary of the warnings counted by f when it returns"""
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        finally:
+            logger.warningSummary()
+    return decorator
@@ -480,11 +480,12 @@ def GOFrequencyBovinePipelines(projectDir):
         logger.info("%s : " % aspect)
         
         A=None
+        nodes=G.get_NodesfromAspect(aspect)
         for pipeName in allPipeName:
-            l=array([log(1+len(pipeline[pipeName].GOtoGP[aspect].get(go, []))) for go in G.get_NodesfromAspect(aspect)])
+            l=array([log(1+len(pipeline[pipeName].GOtoGP[aspect].get(go, []))) for go in nodes])
             l=l/max(l)*256.
             l=[int(round(n)) for n in l]
-            freq=dict([(n,c) for n,c in zip(G.get_NodesfromAspect(aspect), l)])
+            freq=dict([(n,c) for n,c in zip(nodes, l)])
 
             figName="%s/Frequency_%s_%s.png" % (outDir, pipeline[pipeName].name, aspect)
             A=G.plot_FrequencyGraph(aspect, freq, figName=figName, ttl="", graphviz=A)
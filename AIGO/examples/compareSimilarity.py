@@ -63,20 +63,7 @@ def compareSimilarity(projectDir):
     for pipeName in allPipeName:
         FA=pipeline[pipeName]
         logger.info("\t%s" % FA.name)
-        allIC[pipeName]=dict()
-        for a in FA.G.aspect:
-            allIC[pipeName][a]=dict()
-            for go in FA.GOtoGP[a]:
-                n=len(FA.GOtoGP[a][go])
-                for ans in FA.G.ancestors(FA.G.get_intid(go)):
-                    allIC[pipeName][a][ans]=allIC[pipeName][a].get(ans, 0) + n
-
-        for a in FA.G.aspect:
-            if len(allIC[pipeName][a].values())==0:
-                continue
-            m=max(allIC[pipeName][a].values())
-            for go in allIC[pipeName][a]:
-                allIC[pipeName][a][go]=-1. * log(1.*allIC[pipeName][a][go]/m)
+        allIC[pipeName]=FA.IC()
 
 
     #Compare coherence of biological process annotation sets in AFFY given by three different similarity metrics
@@ -0,0 +1,266 @@
+"""
+CSR.py
+
+AIGO is a python library for
+the Analysis and Inter-comparison of Gene Ontology functional annotations.
+see (http://code.google.com/p/aigo).
+
+Created by Michael Defoin-Platel on 21/02/2010.
+Copyright (c) 2010. All rights reserved.
+
+AIGO is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+
+def _freeze(*arrays):
+    for a in arrays:
+        a.flags.writeable = False
+
+
+class CSRGraph(object):
+    """
+    Frozen, read-only compressed sparse row view of a GOGraph.
+
+    Terms are given a dense row index, grouped by aspect and in topological
+    order (roots first), so that the parents of a term always have a smaller row.
+        terms                       - row -> GO term (int value)
+        row                         - GO term -> row
+        parent_indptr, parent_indices, parent_types
+                                    - parents of row r are parent_indices[parent_indptr[r]:parent_indptr[r+1]]
+        child_indptr, child_indices, child_types
+                                    - children of row r, same layout
+        closure_indptr, closure_indices
+                                    - ancestors of row r (itself included), sorted, see get_closure
+    The types arrays give the relationship (IS_A, PART_OF) of each edge.
+    """
+
+    closure_indptr = closure_indices = None
+
+    def __init__(self, G=None):
+        if G is None:
+            return
+
+        parents, children = dict(), dict()
+        for n in G.N:
+            parents[n], children[n] = list(), list()
+
+        #Keep the order in which the edges were added to the graph
+        for n in G.N:
+            for e in G.node_edges[n]:
+                u, v = G.edges_conn[e]
+                if u == n:
+                    parents[u].append((v, G.edge_type(e)))
+                    children[v].append((u, G.edge_type(e)))
+
+        #Topological order of the terms, roots first, one aspect after the other
+        nbParents=dict([(n, len(parents[n])) for n in G.N])
+        nameSpace=getattr(G, 'GONameSpace', dict())
+        order=list()
+        for aspect in sorted(set([nameSpace.get(n) for n in G.N])):
+            queue=sorted([n for n in G.N if nbParents[n]==0 and nameSpace.get(n)==aspect])
+            i=0
+            while i < len(queue):
+                n=queue[i]
+                i=i+1
+                order.append(n)
+                for c, t in children[n]:
+                    nbParents[c]=nbParents[c]-1
+                    if nbParents[c]==0:
+                        queue.append(c)
+
+        if not len(order)==len(G.N):
+            raise Exception("Unable to build the CSR view: the GO graph contains a cycle")
+
+        row=dict([(n, r) for r, n in enumerate(order)])
+
+        self.set_arrays(np.array(order, dtype=np.int32),
+                        self._csr(order, parents, row),
+                        self._csr(order, children, row))
+
+    def _csr(self, order, adjacency, row):
+        indptr=np.zeros(len(order)+1, dtype=np.int32)
+        indptr[1:]=np.cumsum([len(adjacency[n]) for n in order])
+
+        indices=np.array([row[m] for n in order for m, t in adjacency[n]], dtype=np.int32)
+        types=np.array([t for n in order for m, t in adjacency[n]], dtype=np.int8)
+
+        return indptr, indices, types
+
+    def set_arrays(self, terms, parents, children):
+        """
+        Set the arrays of the view from the terms array and the (indptr, indices, types) triples
+        of the parents and of the children
+        """
+        self.terms=terms
+        self.parent_indptr, self.parent_indices, self.parent_types = parents
+        self.child_indptr, self.child_indices, self.child_types = children
+
+        _freeze(self.terms, self.parent_indptr, self.parent_indices, self.parent_types,
+                self.child_indptr, self.child_indices, self.child_types)
+
+        #Plain lists are faster than arrays for node by node traversals
+        self._terms=self.terms.tolist()
+        self.row=dict([(n, r) for r, n in enumerate(self._terms)])
+        indptr, indices = self.parent_indptr.tolist(), self.parent_indices.tolist()
+        self._parents=[indices[indptr[r]:indptr[r+1]] for r in xrange(len(self._terms))]
+
+    def set_closure(self, indptr, indices):
+        """
+        Set the arrays of the ancestor closure
+        """
+        self.closure_indptr, self.closure_indices = indptr, indices
+        _freeze(self.closure_indptr, self.closure_indices)
+
+    def get_closure(self):
+        """
+        Return the (indptr, indices) arrays of the ancestor closure, compute them if needed
+        """
+        if self.closure_indptr is None:
+            #Parents always have a smaller row, one sweep is enough
+            anc=[None]*len(self)
+            for r in xrange(len(self)):
+                s=set([r])
+                for p in self._parents[r]:
+                    s.update(anc[p])
+                anc[r]=s
+
+            indptr=np.zeros(len(self)+1, dtype=np.int32)
+            indptr[1:]=np.cumsum([len(s) for s in anc])
+            indices=np.array([t for s in anc for t in sorted(s)], dtype=np.int32)
+
+            self.set_closure(indptr, indices)
+
+        return self.closure_indptr, self.closure_indices
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, intid):
+        return intid in self.row
+
+    def rows(self, S):
+        """
+        Return the rows of the terms of S, terms not in the graph are ignored
+        """
+        return np.array([self.row[intid] for intid in S if intid in self.row], dtype=np.int32)
+
+    def parents(self, r):
+        """
+        Return the list of the parent rows of row r
+        """
+        return self._parents[r]
+
+    def ancestors(self, intid):
+        """
+        Return the set of ancestors of a term, the term itself included
+        """
+        if intid not in self.row:
+            return set()
+
+        r=self.row[intid]
+        anc=set([r])
+        queue=[r]
+        while len(queue) > 0:
+            t=queue.pop()
+            for p in self._parents[t]:
+                if p not in anc:
+                    anc.add(p)
+                    queue.append(p)
+
+        terms=self._terms
+        return set([terms[t] for t in anc])
+
+    def concepts(self, intid):
+        """
+        Return a dictionary of concept -> depth for the given term
+        """
+        if intid not in self.row:
+            return set()
+
+        r=self.row[intid]
+        depth=dict()
+        processed=set()
+        queue=[(r,1)]
+        while len(queue) > 0:
+            (t,d)=queue.pop()
+            depth[t]=d
+            processed.add(t)
+            for p in self._parents[t]:
+                if p not in processed:
+                    queue.append((p,d+1))
+
+        terms=self._terms
+        return dict([(terms[t], d) for t, d in depth.items()])
+
+    def commonAncestors(self, rows1, rows2):
+        """
+        Return the common ancestors of the pairs of rows (rows1[p], rows2[p]) as two arrays: the pair p and the
+        row of each common ancestor. Negative rows (terms not in the graph) have no ancestor.
+        """
+        width=len(self)
+        common=np.intersect1d(self._ancestorKeys(rows1), self._ancestorKeys(rows2), assume_unique=True)
+
+        return common // width, common % width
+
+    def _ancestorKeys(self, rows):
+        #Ancestors a of each rows[p], encoded as p*len(self)+a
+        closure_indptr, closure_indices = self.get_closure()
+
+        valid=rows >= 0
+        start=np.where(valid, closure_indptr[np.where(valid, rows, 0)], 0)
+        counts=np.where(valid, closure_indptr[np.where(valid, rows, 0)+1]-start, 0)
+
+        pair=np.repeat(np.arange(len(rows), dtype=np.int64), counts)
+        position=np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts) + np.repeat(start, counts)
+
+        return pair*len(self) + closure_indices[position]
+
+    def redundant(self, indptr, rows):
+        """
+        Given annotation sets as (indptr, rows) arrays, the terms of set i being rows[indptr[i]:indptr[i+1]]
+        (-1 for terms not in the graph), return a boolean mask of the terms that are strict ancestors
+        of another term of their set
+        """
+        closure_indptr, closure_indices = self.get_closure()
+        width=len(self)
+
+        owner=np.repeat(np.arange(len(indptr)-1, dtype=np.int64), np.diff(indptr))
+        valid=rows >= 0
+        r, o = rows[valid], owner[valid]
+
+        #Strict ancestors of every term, tagged with the set of the term
+        counts=closure_indptr[r+1]-closure_indptr[r]
+        position=np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts) + np.repeat(closure_indptr[r], counts)
+        ancestor=closure_indices[position]
+        strict=ancestor != np.repeat(r, counts)
+        keys=np.unique(np.repeat(o, counts)[strict]*width + ancestor[strict])
+
+        mask=np.zeros(len(rows), dtype=bool)
+        mask[valid]=np.in1d(o*width + r, keys)
+
+        return mask
+
+    def tips(self):
+        """
+        Return the terms without children
+        """
+        return self.terms[np.diff(self.child_indptr)==0].tolist()
+
+    def roots(self):
+        """
+        Return the terms without parents
+        """
+        return self.terms[np.diff(self.parent_indptr)==0].tolist()
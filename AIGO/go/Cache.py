@@ -0,0 +1,226 @@
+"""
+Cache.py
+
+AIGO is a python library for
+the Analysis and Inter-comparison of Gene Ontology functional annotations.
+see (http://code.google.com/p/aigo).
+
+Created by Michael Defoin-Platel on 21/02/2010.
+Copyright (c) 2010. All rights reserved.
+
+AIGO is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Binary cache of a GOGraph.
+
+The cache is a directory holding one NumPy array (.npy) per table and a
+header.json file. Arrays are opened memory-mapped, so several processes
+reading the same cache share one copy of the ontology.
+    edges           - source, target and type of each edge, in the order they were added
+    terms, parent_*, child_*, closure_*
+                    - the CSR view of the graph and its ancestor closure
+    name_*, def_*   - string tables: term ids and utf-8 encoded, nul terminated, strings
+    nameSpace_*     - term ids and index in the header list of namespaces
+    alt_*           - alternative term ids and their target
+    obsolete        - obsolete term ids
+The header stores the cache version and the size, modification time and
+sha1 hash of the source file. A cache is only used if its version matches
+and if the source file did not change.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+from AIGO.go.Graph import DiGraph
+from AIGO.go.GOGraph import GOGraph
+from AIGO.go.CSR import CSRGraph
+
+CACHE_VERSION = 1
+
+
+def fileSignature(fileName, hash=True):
+    """
+    Return the size, modification time and (optionally) sha1 hash of a file
+    """
+    st=os.stat(fileName)
+    signature={"size": st.st_size, "mtime": st.st_mtime}
+
+    if hash:
+        sha1=hashlib.sha1()
+        with open(fileName, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), ""):
+                sha1.update(chunk)
+        signature["sha1"]=sha1.hexdigest()
+
+    return signature
+
+
+def _saveStrings(cacheDir, name, d):
+    keys=sorted(d)
+    blob="".join(["%s\0" % d[k].encode("utf-8") for k in keys])
+
+    np.save(os.path.join(cacheDir, "%s_ids.npy" % name), np.array(keys, dtype=np.int32))
+    np.save(os.path.join(cacheDir, "%s_blob.npy" % name), np.array(bytearray(blob), dtype=np.uint8))
+
+
+def _loadStrings(arrays, name):
+    ids=arrays["%s_ids" % name].tolist()
+    strings=arrays["%s_blob" % name].tostring().decode("utf-8").split(u"\0")
+
+    return dict(zip(ids, strings))
+
+
+def saveGOGraph(G, cacheDir, source):
+    """
+    Save the GO graph G read from the file source in the cache directory cacheDir
+    """
+    tmpDir="%s.%d.tmp" % (cacheDir, os.getpid())
+    if os.path.exists(tmpDir):
+        shutil.rmtree(tmpDir)
+    os.makedirs(tmpDir)
+
+    def save(name, a):
+        np.save(os.path.join(tmpDir, "%s.npy" % name), a)
+
+    #Edges, in the order they were added
+    E=sorted(G.edges_conn)
+    save("edge_source", np.array([G.edges_conn[e][0] for e in E], dtype=np.int32))
+    save("edge_target", np.array([G.edges_conn[e][1] for e in E], dtype=np.int32))
+    save("edge_type",   np.array([G.edge_type(e) for e in E], dtype=np.int8))
+
+    #CSR view and ancestor closure
+    csr=G.get_CSR()
+    closure_indptr, closure_indices = csr.get_closure()
+    for name in ["terms", "parent_indptr", "parent_indices", "parent_types",
+                 "child_indptr", "child_indices", "child_types", "closure_indptr", "closure_indices"]:
+        save(name, getattr(csr, name))
+
+    #String tables
+    _saveStrings(tmpDir, "name", getattr(G, "GOName", dict()))
+    _saveStrings(tmpDir, "def", getattr(G, "GODef", dict()))
+
+    GONameSpace=getattr(G, "GONameSpace", dict())
+    nameSpaces=sorted(set(GONameSpace.values()))
+    ids=sorted(GONameSpace)
+    save("nameSpace_ids", np.array(ids, dtype=np.int32))
+    save("nameSpace_codes", np.array([nameSpaces.index(GONameSpace[k]) for k in ids], dtype=np.int8))
+
+    GOAlt=getattr(G, "GOAlt", dict())
+    ids=sorted(GOAlt)
+    save("alt_ids", np.array(ids, dtype=np.int32))
+    save("alt_targets", np.array([GOAlt[k] for k in ids], dtype=np.int32))
+
+    save("obsolete", np.array(sorted(getattr(G, "GOObsolete", set())), dtype=np.int32))
+
+    header={"version": CACHE_VERSION,
+            "source": fileSignature(source),
+            "prefix": G.prefix,
+            "aspect": G.aspect,
+            "nameSpaces": nameSpaces}
+    with open(os.path.join(tmpDir, "header.json"), "w") as f:
+        json.dump(header, f)
+
+    if os.path.exists(cacheDir):
+        shutil.rmtree(cacheDir)
+    os.rename(tmpDir, cacheDir)
+
+
+def isValidCache(cacheDir, source):
+    """
+    Return True if the cache directory cacheDir is up to date with respect to the file source
+    """
+    try:
+        with open(os.path.join(cacheDir, "header.json")) as f:
+            header=json.load(f)
+    except (IOError, ValueError):
+        return False
+
+    if not header.get("version")==CACHE_VERSION:
+        return False
+
+    cached=header["source"]
+    signature=fileSignature(source, hash=False)
+    if not signature["size"]==cached["size"]:
+        return False
+
+    #Same size but touched: compare the content
+    if not signature["mtime"]==cached["mtime"]:
+        if not fileSignature(source)["sha1"]==cached["sha1"]:
+            return False
+
+        #Same content, remember the new modification time
+        cached["mtime"]=signature["mtime"]
+        try:
+            with open(os.path.join(cacheDir, "header.json"), "w") as f:
+                json.dump(header, f)
+        except IOError:
+            pass
+
+    return True
+
+
+def loadGOGraph(cacheDir, source):
+    """
+    Load a GO graph from the cache directory cacheDir.
+    None is returned if the cache is missing or out of date with respect to the file source.
+    """
+    if not isValidCache(cacheDir, source):
+        return None
+
+    with open(os.path.join(cacheDir, "header.json")) as f:
+        header=json.load(f)
+
+    arrays=dict()
+    for fileName in os.listdir(cacheDir):
+        if fileName.endswith(".npy"):
+            arrays[fileName[:-4]]=np.load(os.path.join(cacheDir, fileName), mmap_mode="r")
+
+    G=GOGraph.__new__(GOGraph)
+    DiGraph.__init__(G)
+
+    G.prefix=str(header["prefix"])
+    G.aspect=[str(a) for a in header["aspect"]]
+    G.ancestors_cache = {}
+    G.concepts_cache = {}
+    G.normal_cache = {}
+
+    #Rebuild the graph structure in bulk, edge ids are kept
+    edge_source, edge_target = arrays["edge_source"].tolist(), arrays["edge_target"].tolist()
+    G.edge_types=arrays["edge_type"].tolist()
+    G.node_edges=dict([(n, []) for n in arrays["terms"].tolist()])
+    for e, (u, v) in enumerate(zip(edge_source, edge_target)):
+        G.edges_conn[e]=(u, v)
+        G.node_edges[u].append(e)
+        if u != v:
+            G.node_edges[v].append(e)
+    G.next_default_edge_name=len(edge_source)
+
+    G.csr=CSRGraph()
+    G.csr.set_arrays(arrays["terms"],
+                     (arrays["parent_indptr"], arrays["parent_indices"], arrays["parent_types"]),
+                     (arrays["child_indptr"], arrays["child_indices"], arrays["child_types"]))
+    G.csr.set_closure(arrays["closure_indptr"], arrays["closure_indices"])
+
+    G.GOName=_loadStrings(arrays, "name")
+    G.GODef=_loadStrings(arrays, "def")
+
+    nameSpaces=header["nameSpaces"]
+    G.GONameSpace=dict(zip(arrays["nameSpace_ids"].tolist(), [nameSpaces[c] for c in arrays["nameSpace_codes"].tolist()]))
+    G.GOAlt=dict(zip(arrays["alt_ids"].tolist(), arrays["alt_targets"].tolist()))
+    G.GOObsolete=set(arrays["obsolete"].tolist())
+
+    return G
@@ -0,0 +1,152 @@
+"""
+Closure.py
+
+AIGO is a python library for
+the Analysis and Inter-comparison of Gene Ontology functional annotations.
+see (http://code.google.com/p/aigo).
+
+Created by Michael Defoin-Platel on 21/02/2010.
+Copyright (c) 2010. All rights reserved.
+
+AIGO is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+def popcount(bits):
+    """Number of bits set in a bitset"""
+    return bin(bits).count("1")
+
+
+class ClosureIndex(object):
+    """
+    Ancestor closure of a GOGraph, stored as one bitset per GO term.
+
+    Terms share the dense row index of the CSR view of the graph, in which
+    the ancestors of a term always have a smaller row.
+    The bitset of a term is a long integer in which bit i stands for row lo+i,
+    lo being the smallest row among its ancestors: rows of an aspect only span
+    that aspect instead of the whole ontology.
+    """
+
+    def __init__(self, csr):
+        self.terms=csr._terms
+        self.row=csr.row
+
+        #One sweep in topological order: the closure of a term is itself plus the closure of its parents
+        self.lo=[0]*len(csr)
+        self.bits=[0]*len(csr)
+        for r in xrange(len(csr)):
+            rp=csr.parents(r)
+            lo=min([self.lo[p] for p in rp] + [r])
+            bits = 1 << (r-lo)
+            for p in rp:
+                bits = bits | (self.bits[p] << (self.lo[p]-lo))
+            self.lo[r]=lo
+            self.bits[r]=bits
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, intid):
+        return intid in self.row
+
+    def mask(self, S):
+        """
+        Return the union of the closures of the terms in S as a (lo, bits) pair.
+        Terms that are not in the index are ignored.
+        """
+        rows=[self.row[intid] for intid in S if intid in self.row]
+        if len(rows)==0:
+            return 0, 0
+
+        lo=min([self.lo[r] for r in rows])
+        bits=0
+        for r in rows:
+            bits = bits | (self.bits[r] << (self.lo[r]-lo))
+
+        return lo, bits
+
+    def decode(self, lo, bits):
+        """
+        Return the list of terms of a (lo, bits) pair
+        """
+        s=bin(bits)[2:]
+        top=lo+len(s)-1
+
+        terms=list()
+        i=s.find("1")
+        while i >= 0:
+            terms.append(self.terms[top-i])
+            i=s.find("1", i+1)
+
+        return terms
+
+    def ancestors(self, intid):
+        """
+        Return the set of ancestors of a term, the term itself included
+        """
+        if intid not in self.row:
+            return set()
+
+        r=self.row[intid]
+        return set(self.decode(self.lo[r], self.bits[r]))
+
+    def count(self, intid):
+        """
+        Return the number of ancestors of a term, the term itself included
+        """
+        if intid not in self.row:
+            return 0
+
+        return popcount(self.bits[self.row[intid]])
+
+    def induced(self, S):
+        """
+        Return the set of terms induced by S, i.e. the union of their ancestors
+        """
+        lo, bits = self.mask(S)
+        return set(self.decode(lo, bits))
+
+    def intersection(self, S1, S2):
+        """
+        Return the sizes of the intersection and of the union of the sets induced by S1 and S2
+        """
+        lo1, bits1 = self.mask(S1)
+        lo2, bits2 = self.mask(S2)
+
+        lo=min(lo1, lo2)
+        bits1 = bits1 << (lo1-lo)
+        bits2 = bits2 << (lo2-lo)
+
+        return popcount(bits1 & bits2), popcount(bits1 | bits2)
+
+    def redundant(self, S):
+        """
+        Return the terms of S that are strict ancestors of another term of S
+        """
+        rows=[self.row[intid] for intid in set(S) if intid in self.row]
+        if len(rows) < 2:
+            return list()
+
+        lo=min([self.lo[r] for r in rows])
+        inS=0
+        for r in rows:
+            inS = inS | (1 << (r-lo))
+
+        bits=0
+        for r in rows:
+            strict = self.bits[r] ^ (1 << (r-self.lo[r]))
+            bits = bits | (strict << (self.lo[r]-lo))
+
+        return self.decode(lo, bits & inS)
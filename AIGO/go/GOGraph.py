@@ -1,20 +1,28 @@
-from pylab import *
+from numpy import *
 
 
 from xml.sax import make_parser
 
 from AIGO.go.Graph import DiGraph
 from AIGO.go.GOHandler  import GOHandler
-
-def get_GOGraph(f_stream, prefix="GO"):
-    """Constructs a GO tree (GOGraph) from the provided stream.  Reads xml format only."""
-
-    parser = make_parser()
-    cH = GOHandler()
-    parser.setContentHandler(cH)
-    parser.parse(f_stream)
+from AIGO.go.OBOHandler  import OBOHandler
+from AIGO.go.CSR import CSRGraph
+from AIGO.go.Closure import ClosureIndex
+from AIGO.InformationContent import ICTable
+
+def get_GOGraph(f_stream, prefix="GO", closure=False, fileFormat="obo-xml"):
+    """Constructs a GO tree (GOGraph) from the provided stream.  Reads OBO-XML (obo-xml) or OBO flat file (obo) format."""
+
+    if fileFormat=="obo":
+        cH = OBOHandler()
+        cH.parse(f_stream)
+    else:
+        parser = make_parser()
+        cH = GOHandler()
+        parser.setContentHandler(cH)
+        parser.parse(f_stream)
     f_stream.close()
-    return GOGraph(cH.terms, cH.edges, GOName=cH.GOName, GODef=cH.GODef, GOAlt=cH.GOAlt, GONameSpace=cH.GONameSpace, GOObsolete=cH.GOObsolete, prefix=prefix)
+    return GOGraph(cH.terms, cH.edges, GOName=cH.GOName, GODef=cH.GODef, GOAlt=cH.GOAlt, GONameSpace=cH.GONameSpace, GOObsolete=cH.GOObsolete, prefix=prefix, closure=closure)
 
 
 class GOGraph(DiGraph):
@@ -22,12 +30,22 @@ class GOGraph(DiGraph):
     Each node in GOGraph is the GO:id term (int value).  Each edge connects the term,
     the relationship can be found by calling which(edge_num)
     """
+
+    #Frozen CSR view of the graph, see build_csr
+    csr = None
+
+    #Optional ancestor closure index, see build_closure
+    closure = None
+
+    #Per-aspect index of the terms, see build_aspects
+    aspect_index = None
     
-    def __init__(self, terms, edges, GOName=None, GODef=None, GOAlt=None, GONameSpace=None, GOObsolete=None, prefix="GO"):
+    def __init__(self, terms, edges, GOName=None, GODef=None, GOAlt=None, GONameSpace=None, GOObsolete=None, prefix="GO", closure=False):
         """
         Construct GOGraph with parameters:
             terms - list of ints
             edges - list tuples (int,P int, edge_type)
+            closure - if True, build the ancestor closure index at once
         Use get_GOGraph to generate the GO graph from a stream.
         """
         DiGraph.__init__(self)
@@ -39,6 +57,7 @@ class GOGraph(DiGraph):
         self.edge_types = [0 for i in range(len(edges))]
         self.ancestors_cache = {}
         self.concepts_cache = {}
+        self.normal_cache = {}
             
         for (u,v,type) in edges:
             self.add_edge(u,v,type)
@@ -59,6 +78,36 @@ class GOGraph(DiGraph):
         if GOObsolete:
             self.GOObsolete=GOObsolete
 
+        self.build_csr()
+
+        if closure:
+            self.build_closure()
+
+    def build_csr(self):
+        """
+        Build the frozen CSR view of the graph (dense term index, parents and children arrays) used for traversals
+        """
+        self.csr = CSRGraph(self)
+        self.ancestors_cache = {}
+        self.concepts_cache = {}
+        self.normal_cache = {}
+
+    def get_CSR(self):
+        """
+        Return the CSR view of the graph, build it if needed
+        """
+        if self.csr is None:
+            self.build_csr()
+
+        return self.csr
+
+    def build_closure(self):
+        """
+        Build the ancestor closure index (one bitset per term) used by ancestors, induced and get_Redundant
+        """
+        self.closure = ClosureIndex(self.get_CSR())
+        self.ancestors_cache = {}
+
     def deep_copy(self):
         """
         Return a deep copy of this GOGraph
@@ -102,27 +151,24 @@ class GOGraph(DiGraph):
         if self.ancestors_cache.has_key(intid):
             return self.ancestors_cache.get(intid)
         
+        if self.closure is not None:
+            anc = self.closure.ancestors(intid)
+            self.ancestors_cache[intid] = anc
+            return anc
+
         if intid not in self.N:
             return set()
         
-        anc = set()
-        anc.add(intid)
-        processed = set()
-        queue = self.neighbors(intid)
-        
-        while len(queue) > 0:
-            t = queue.pop()
-            anc.add(t)
-            processed.add(t)
-            for tp in self.neighbors_iter(t):
-                if tp not in processed:
-                    queue.append(tp)
+        anc = self.get_CSR().ancestors(intid)
         
         self.ancestors_cache[intid] = anc
         
         return anc
 
     def induced(self, S):
+        if self.closure is not None:
+            return self.closure.induced(S)
+
         U=set()
         for intid in S:
             U = U | self.ancestors(intid)
@@ -141,18 +187,7 @@ class GOGraph(DiGraph):
         if intid not in self.N:
             return set()
         
-        anc = {}
-        processed = set()
-        #queue = self.neighbors( (intid,1) )
-        queue = [(intid,1)]
-        
-        while len(queue) > 0:
-            (t,depth) = queue.pop()
-            anc[t] = depth
-            processed.add(t)
-            for tp in self.neighbors_iter(t):
-                if tp not in processed:
-                    queue.append( (tp,depth+1) )
+        anc = self.get_CSR().concepts(intid)
 
         self.concepts_cache[intid] = anc
         
@@ -163,6 +198,8 @@ class GOGraph(DiGraph):
 
     def add_term(self,go):
         self.N.add(go)
+        self.csr = self.closure = self.aspect_index = None
+        self.normal_cache = {}
     
     def edge_type(self,eid):
         return self.edge_types[eid]
@@ -173,35 +210,14 @@ class GOGraph(DiGraph):
         """
         e = self.E.add(go1, go2)
         self.edge_types[e] = type
+        self.csr = self.closure = self.aspect_index = None
+        self.normal_cache = {}
 
     def tips(self):
-        from itertools import repeat
-
-        tips=dict(zip(self.N(), repeat(True)))
-
-        for u,v in self.edges_conn.values():
-            tips[v]=False
-            
-        return [t for t in tips if tips[t]]
+        return self.get_CSR().tips()
     
     def roots(self):
-
-        roots=list()
-        for aspect in self.aspect:
-            for n in self.N():
-                if aspect==self.GONameSpace[n]:
-                    break
-
-            c=self.concepts(n)
-            idx=argsort(c.values())
-
-            o=-1
-            while not len(self.ancestors(c.keys()[idx[o]]))==1:
-                o=o-1
-            
-            roots.append(c.keys()[idx[o]])
-
-        return sort(roots)
+        return sort(self.get_CSR().roots())
 
 
     def subgraph(self,nodes=None,edges=None):
@@ -214,41 +230,58 @@ class GOGraph(DiGraph):
 #  Semantic Distance 
 #------------------------------------------------------------------
 
-    def GS2(self, G):
+    def GS2(self, G, gN=None):
         """
         Calculates GS2 measure on gene set G. G is a list (or set) of annotation sets (in int format)
         Valid G = [ [456,897], [23690,1230,23450], ... ]
         Valid GO ids are 4568, 2009, NOT GO:0003456 or 0003456
+        gN are the counts of GS2Counts(G), computed if not given
         """
 
         if len(G)==0:
             return 0,[0]
         
-        gN = {}
+        if gN is None:
+            gN = self.GS2Counts(G)
+
         gP = {}
         G = zip(range(len(G)),G)
         for (i,g) in G:
-            parents = set(g)
             for intid in g:
                 gP[intid] =  self.ancestors(intid)
-                parents = parents | gP[intid]
-            for intid in parents:
-                gN[intid] = gN.get(intid,0) + 1
             
-        # calculate similarity
-        l=[ self._trank(g,G,gP,gN) for (i,g) in G]
+        # calculate similarity, the rank of each term is computed once
+        rank = {}
+        l=[ self._trank(g,G,gP,gN,rank) for (i,g) in G]
         sim = sum(l)/len(G)
 
         return sim, l
+
+    def GS2Counts(self, G):
+        """
+        Count, for each GO term, the annotation sets of G (in int format) including this term or one of its descendants
+        """
+
+        gN = {}
+        for g in G:
+            parents = set(g)
+            for intid in g:
+                parents = parents | self.ancestors(intid)
+            for intid in parents:
+                gN[intid] = gN.get(intid,0) + 1
+
+        return gN
     
-    def _trank(self, g, G, gP, gN):
+    def _trank(self, g, G, gP, gN, rank):
         if len(g) == 0:
             return 0
         
         s = 0
         for i in g:
             if len(gP[i]) > 0:
-                s += sum([ gN[j] - 1 for j in gP[i] ]) / ( len(gP[i])*(len(G)-1.0) )
+                if not rank.has_key(i):
+                    rank[i] = sum([ gN[j] - 1 for j in gP[i] ]) / ( len(gP[i])*(len(G)-1.0) )
+                s += rank[i]
         
         return s/len(g)
 
@@ -258,6 +291,10 @@ class GOGraph(DiGraph):
         Calculates CzekanowskiDice semantic similarity between two sets of annotations (in int format)
         """
 
+        if self.closure is not None:
+            I, U = self.closure.intersection(GO1, GO2)
+            return 1.- (1.0 * (U-I) )/ (U+I)
+
         induced_GO1=self.induced(GO1)
         induced_GO2=self.induced(GO2)
 
@@ -271,17 +308,17 @@ class GOGraph(DiGraph):
         """
         Calculates Resnik semantic similarity between two sets of annotations (in int format)
         The mean pairwise term similiarity is returned
+        With an ICTable, the term similarities are read from its MICA table
         """
 
-        D=dict()
-        for go1 in GO1:
-            for go2 in GO2:
-                g1,g2=sort([go1,go2])                
-                D.setdefault(g1,dict()).update({g2:self._minimumSubsumer(g1,g2,IC)})
+        if isinstance(IC, ICTable):
+            return IC.micaTable().similarity(GO1, GO2)
 
+        #The similarity of terms is symmetric: D[i][j] for the i-th term of GO1 and the j-th term of GO2
+        D=[[self._minimumSubsumer(go1,go2,IC) for go2 in GO2] for go1 in GO1]
 
-        M1=mean([max([D[sort([go1,go2])[0]][sort([go1,go2])[1]] for go2 in GO2]) for go1 in GO1])
-        M2=mean([max([D[sort([go1,go2])[0]][sort([go1,go2])[1]] for go1 in GO1]) for go2 in GO2])
+        M1=mean([max(d) for d in D])
+        M2=mean([max(d) for d in zip(*D)])
 
 
         return (M1+M2)/2.0, [M1,M2]
@@ -290,6 +327,8 @@ class GOGraph(DiGraph):
         go1=self.GOAlt.get(go1,go1)
         go2=self.GOAlt.get(go2,go2)
         common=self.ancestors(go1).intersection(self.ancestors(go2))
+        if isinstance(IC, ICTable):
+            return IC.maximum(common)
         return max([IC[self.GONameSpace[go]][go] for go in common])
         
 #------------------------------------------------------------------
@@ -310,29 +349,38 @@ class GOGraph(DiGraph):
         """Convert integers to GO ids"""
         return [self.get_goid(intid) for intid in S]
 
+    def normalize(self, go):
+        """
+        Return the canonical GO id of go (its alternative if any), its aspect (None if unknown)
+        and its row in the CSR view (-1 if not in the graph).
+        Results are memoized in a table shared by all the readers of annotation files.
+        """
+        try:
+            return self.normal_cache[go]
+        except KeyError:
+            intid=self.get_intid(go)
+            intid=self.GOAlt.get(intid, intid)
+
+            normal=(self.get_goid(intid), self.GONameSpace.get(intid, None), self.get_CSR().row.get(intid, -1))
+            self.normal_cache[go]=normal
+
+            return normal
+
     def get_GOAlternative(self, go, nameSpace=True):
-        intid=self.get_intid(go)
-    
-        intid=self.GOAlt.get(intid, intid)
+        goid, aspect, row = self.normalize(go)
 
         if nameSpace:
-            return self.get_goid(intid), self.GONameSpace.get(intid, None)
+            return goid, aspect
         else:
-            return self.get_goid(intid)
+            return goid
 
     def get_GOName(self, go):
-        intid=self.get_intid(go)
-
-        intid=self.GOAlt.get(intid, intid)
+        intid=self.get_intid(self.normalize(go)[0])
 
         return self.GOName.get(intid, "")
 
     def get_GONameSpace(self, go):
-        intid=self.get_intid(go)
-
-        intid=self.GOAlt.get(intid, intid)
-
-        return self.GONameSpace.get(intid, "")
+        return self.normalize(go)[1] or ""
 
     def isObsolete(self, goid):
         return self.get_intid(goid) in self.GOObsolete
@@ -344,14 +392,56 @@ class GOGraph(DiGraph):
 
         return intid in self.GOObsolete
 
+    def build_aspects(self):
+        """
+        Build the per-aspect index of the terms: for each aspect, the GO ids of its terms and the sorted arrays of
+        their distinct int values once mapped to their alternative, with and without the obsolete terms
+        """
+        GOAlt=getattr(self, "GOAlt", dict())
+        obsolete=array(sorted(getattr(self, "GOObsolete", set())), dtype=int)
+
+        terms=list(self.N())
+        nameSpace=[self.GONameSpace.get(intid) for intid in terms]
+
+        self.aspect_index = {}
+        for aspect in self.aspect:
+            nodes=[intid for intid, a in zip(terms, nameSpace) if a==aspect]
+            canonical=unique(array([GOAlt.get(intid, intid) for intid in nodes], dtype=int))
+            self.aspect_index[aspect]=(self.InttoGO(nodes), canonical, setdiff1d(canonical, obsolete))
+
+    def get_AspectTerms(self, aspect, obsolete=True):
+        """
+        Return the sorted array of the distinct terms (in int format) of an aspect once mapped to their alternative,
+        without the obsolete terms if obsolete is False
+        """
+        if self.aspect_index is None:
+            self.build_aspects()
+
+        if not self.aspect_index.has_key(aspect):
+            return array([], dtype=int)
+
+        return self.aspect_index[aspect][1 if obsolete else 2]
+
+    def get_AspectSize(self, aspect, obsolete=True):
+        return len(self.get_AspectTerms(aspect, obsolete))
+
     def get_NodesfromAspect(self, aspect):
-        return self.InttoGO([n for n in self.N() if self.GONameSpace[n]==aspect])
+        if self.aspect_index is None:
+            self.build_aspects()
+
+        if not self.aspect_index.has_key(aspect):
+            return []
+
+        return list(self.aspect_index[aspect][0])
 
     def get_Redundant(self, S):
         """
         Get the redundant annotations in a set
         """
 
+        if self.closure is not None:
+            return self.InttoGO(self.closure.redundant(self.GOtoInt(S)))
+
         redundant=set()
         S=self.GOtoInt(S)
         for intid in S:
@@ -361,6 +451,38 @@ class GOGraph(DiGraph):
             
         return self.InttoGO(redundant)
 
+    def get_MostSpecific(self, M):
+        """
+        Split many annotation sets at once into their redundant terms (ancestors of another term of the set)
+        and their most specific terms, in one pass over the ancestor closure.
+        M maps keys (e.g. gene products) to sets of GO ids. Return two dictionaries holding the redundant
+        and the most specific terms of the sets with redundant terms, the other sets are already minimal.
+        """
+        csr=self.get_CSR()
+
+        keys, terms, sizes = list(), list(), list()
+        for k, S in M.iteritems():
+            keys.append(k)
+            terms.extend(S)
+            sizes.append(len(S))
+
+        indptr=zeros(len(sizes)+1, dtype=int64)
+        indptr[1:]=cumsum(sizes)
+        rows=array([csr.row.get(intid, -1) for intid in self.GOtoInt(terms)], dtype=int64)
+
+        mask=csr.redundant(indptr, rows)
+        owner=repeat(arange(len(sizes)), sizes)
+
+        allRedundant=dict()
+        for i, t in zip(owner[mask].tolist(), flatnonzero(mask).tolist()):
+            allRedundant.setdefault(keys[i], list()).append(terms[t])
+
+        allMinimal=dict()
+        for k, R in allRedundant.iteritems():
+            allMinimal[k]=[goid for goid in M[k] if not goid in R]
+
+        return allRedundant, allMinimal
+
     def get_Parents(self, goid):
         intid=self.get_intid(goid)
 
@@ -526,6 +648,7 @@ class GOGraph(DiGraph):
 
     def plot_FrequencyGraph(self, aspect, freq, figName="induced.png", ttl="", graphviz=None):
         import pygraphviz as pgv
+        from matplotlib import cm
         
         cmap=cm.hot_r
 
@@ -28,45 +28,58 @@ import os
 from AIGO import logger, logFun
 from AIGO.utils.File  import checkForZip, readFile
 from AIGO.go.GOGraph import get_GOGraph
+from AIGO.go.Cache import loadGOGraph, saveGOGraph
 
 #------------------------------------------------------------------------------------
 @logFun("Creating GO graph")
-def readGOoboXML(fileName, force=False, prefix="GO"):
-    import cPickle as pickle
-
-    picName="%s.pic" % fileName
-    if (not os.path.exists(picName)):
-        force=True
-
-    if not force:
-        try:
-            logger.info("Reading serialized OBO file : %s" % picName)
-            with open(picName, "rb") as f:
-                
-                G = pickle.load(f)
-                f.close()
-        except IOError as (inst):
-            print str(type(inst))+ " for "+picName
-            force=True
-        except EOFError as (inst):  ##its an empty file?
-            print str(type(inst))+" for "+picName
-            force=True
+def readGOoboXML(fileName, force=False, prefix="GO", closure=False):
+    """
+    Read a GO graph from an OBO-XML file.
+    The graph is saved in a binary cache, <fileName>.cache, which is used instead of the OBO-XML file
+    as long as the latter does not change. Use force=True to ignore the cache.
+    """
+
+    return _readGOGraph(fileName, "obo-xml", force, prefix, closure)
+
+@logFun("Creating GO graph")
+def readGOobo(fileName, force=False, prefix="GO", closure=False):
+    """
+    Read a GO graph from an OBO 1.2/1.4 flat file, see readGOoboXML for the binary cache.
+    """
+
+    return _readGOGraph(fileName, "obo", force, prefix, closure)
+
+def _readGOGraph(fileName, fileFormat, force, prefix, closure):
+    cacheName="%s.cache" % fileName
 
     try:
-        if force:
-            fileName= checkForZip(fileName)
-            if (not os.path.exists(fileName)):
-                raise IOError(fileName+" does not exist and is required ")
+        source= checkForZip(fileName)
+        if (not os.path.exists(source)):
+            raise IOError(source+" does not exist and is required ")
+
+        G=None
+        if not force:
+            logger.info("Reading cached OBO file : %s" % cacheName)
+            G = loadGOGraph(cacheName, source)
+            if G is None:
+                logger.info("No valid cache found")
 
-            logger.info("Reading OBO file : %s" % fileName)
+        if G is None:
+            logger.info("Reading OBO file : %s" % source)
             
-            G = get_GOGraph(readFile(fileName, mode="r"), prefix=prefix)
-            G.fileName=fileName
+            G = get_GOGraph(readFile(source, mode="r"), prefix=prefix, fileFormat=fileFormat)
+
+            try:
+                logger.info("Saving cached OBO file")
+                saveGOGraph(G, cacheName, source)
+            except (IOError, OSError), e:
+                logger.handleWarning("Unable to save cache %s: %s" % (cacheName, str(e)))
+
+        G.fileName=source
 
-            with open(picName, "wb") as f:
-                logger.info("Saving serialized OBO file")
-                pickle.dump(G, f, -1)
-            f.close()
+        if closure and G.closure is None:
+            logger.info("Building ancestor closure index")
+            G.build_closure()
     except Exception, e:
         logger.handleFatal("Unable to read file %s: %s" % (fileName, str(e)))
     
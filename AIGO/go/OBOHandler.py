@@ -0,0 +1,90 @@
+import re
+
+IS_A = 0
+PART_OF = 1
+
+def get_intid(goid):
+    return int(goid[3:])
+
+#Quoted text of a def: tag, backslash escapes allowed
+defPattern = re.compile(r'^"((?:[^"\\]|\\.)*)"')
+escapePattern = re.compile(r'\\(.)')
+escapes = {'n': '\n', 't': '\t', 'W': ' '}
+
+def unescape(value):
+    return escapePattern.sub(lambda m: escapes.get(m.group(1), m.group(1)), value)
+
+
+class OBOHandler(object):
+    """
+    Streaming reader of the OBO 1.2/1.4 flat file format.
+    Fills the same tables as GOHandler (terms, edges, GOName, GODef, GOAlt, GONameSpace, GOObsolete)
+    in a single pass over the lines of the file.
+    """
+
+    def __init__(self,):
+        self.edges = []
+        self.terms = []
+        self.GOAlt = dict()
+        self.GONameSpace = dict()
+        self.GOName = dict()
+        self.GODef= dict()
+        self.GOObsolete = set()
+        self.id = None
+
+    def parse(self, f_stream):
+        inTerm = False
+        for line in f_stream:
+            line = line.strip()
+
+            if len(line)==0 or line[0]=='!':
+                continue
+
+            if line[0]=='[':
+                self.endTerm()
+                inTerm = (line=='[Term]')
+                continue
+
+            if not inTerm:
+                continue
+
+            i = line.find(':')
+            if i < 0:
+                continue
+
+            self.tag(line[:i], line[i+1:].strip())
+
+        self.endTerm()
+
+    def endTerm(self):
+        if self.id is not None:
+            self.terms.append(self.id)
+            self.id = None
+
+    def tag(self, name, value):
+        if name == 'id':
+            self.id = get_intid(value)
+            self.GODef[self.id]=''
+        elif self.id is None:
+            return
+        elif name == 'is_a':
+            self.edges.append( (self.id, get_intid(value.split()[0]), IS_A ) )
+        elif name == 'relationship':
+            v = value.split()
+            if v[0] == 'part_of':
+                self.edges.append( (self.id, get_intid(v[1]), PART_OF ) )
+        elif name == 'is_obsolete':
+            if value.split()[0] == 'true':
+                self.GOObsolete.add(self.id)
+        elif name == 'alt_id':
+            self.GOAlt[get_intid(value.split()[0])]=self.id
+        elif name == 'consider' or name == 'replaced_by':
+            self.GOAlt[self.id]=get_intid(value.split()[0])
+        elif name == 'name':
+            self.GOName[self.id]=value.decode('utf-8')
+        elif name == 'namespace':
+            self.GONameSpace[self.id]=value.split()[0].decode('utf-8')
+        elif name == 'def':
+            m = defPattern.match(value)
+            if m:
+                self.GODef[self.id]=unescape(m.group(1)).decode('utf-8')
@@ -1,11 +1,120 @@
+import os
+import multiprocessing
+
+from numpy import mean
+
+from AIGO import logger
 from AIGO.Statistics import registerStat as rS
 from AIGO.Analyse import AnalyseFA
+from AIGO.Compare import CompareFA
+
+#Effector and arguments of the current parallel batch, inherited by the forked workers
+_batch = None
 
 
 def batchExecute(lFunc, effector, *args, **kargs):
+    """
+    Call the methods lFunc of effector with the given arguments, one after the other.
+    With workers=N (N>1), the statistics of AnalyseFA and CompareFA are computed by a pool of N processes,
+    see parallelExecute.
+    """
+    workers=kargs.pop("workers", None)
+
+    if workers > 1 and isinstance(effector, (AnalyseFA, CompareFA)):
+        if hasattr(os, "fork"):
+            return parallelExecute(lFunc, effector, workers, *args, **kargs)
+        logger.handleWarning("Parallel execution requires fork, statistics are computed serially")
+
     for func in lFunc:
         if hasattr(effector, func):
             if isinstance (effector, AnalyseFA) and not rS.isRegistered(func):
                 print "Warning, call of an unregistered statistics : %s"  % func
-                
+
             getattr(effector, func)(*args, **kargs)
+
+
+def parallelExecute(lFunc, effector, workers, allFA, *args, **kargs):
+    """
+    Compute the statistics lFunc with a pool of processes.
+    For AnalyseFA, each (statistic, FA, aspect) triple is a unit of work for the statistics registered as per aspect,
+    each (statistic, FA) pair for the others. For CompareFA, each statistic is a unit.
+    The workers are forked, they share the GO graphs and annotations with the parent process (copy-on-write),
+    and send back the entries they add to the FA and effector dictionaries.
+    Statistics that modify the annotations (remove*) are run in the parent process and split the batch.
+    """
+    global _batch
+
+    units=list()
+    for func in lFunc + [None]:
+        if func is not None and not hasattr(effector, func):
+            continue
+
+        if func is not None and isinstance (effector, AnalyseFA) and not rS.isRegistered(func):
+            print "Warning, call of an unregistered statistics : %s"  % func
+
+        if func is None or func.startswith("remove"):
+            #Run the pending units before the annotations change
+            if len(units) > 0:
+                _batch=(effector, allFA, args, kargs)
+                pool=multiprocessing.Pool(min(workers, len(units)))
+                try:
+                    results=pool.map(_executeUnit, units)
+                finally:
+                    pool.close()
+                    pool.join()
+                    _batch=None
+
+                perAspect=dict()
+                for (unitFunc, i, aspect), (newEffector, newFA) in zip(units, results):
+                    effector.update(newEffector)
+                    for j in newFA:
+                        if aspect is None:
+                            allFA[j].update(newFA[j])
+                        else:
+                            for k in newFA[j]:
+                                perAspect.setdefault((j, unitFunc, k), dict())[aspect]=newFA[j][k][aspect]
+
+                #Statistics computed one aspect at a time: the mean over the aspects is added to their main key
+                for (j, unitFunc, k), values in perAspect.items():
+                    if k==unitFunc:
+                        values['All_aspects_of_GO']=mean([mean(values[a]) for a in allFA[j].G.aspect])
+                    allFA[j][k]=values
+                units=list()
+
+            if func is not None:
+                getattr(effector, func)(allFA, *args, **kargs)
+
+        elif isinstance(effector, AnalyseFA) and rS.isPerAspect(func):
+            units.extend([(func, i, a) for i in range(len(allFA)) for a in allFA[i].G.aspect])
+        elif isinstance(effector, AnalyseFA):
+            units.extend([(func, i, None) for i in range(len(allFA))])
+        else:
+            units.append((func, None, None))
+
+
+def _changes(d, before):
+    return dict([(k, v) for k, v in d.items() if not before.has_key(k) or before[k] is not v])
+
+
+def _executeUnit(unit):
+    """
+    Compute one unit of work in a worker, return the new entries of the effector and FA dictionaries
+    """
+    effector, allFA, args, kargs = _batch
+    func, i, aspect = unit
+    if aspect is not None:
+        kargs=dict(kargs, aspects=[aspect])
+
+    if i is None:
+        lFA=allFA
+        idx=range(len(allFA))
+    else:
+        lFA=[allFA[i]]
+        idx=[i]
+
+    before=[dict(FA) for FA in lFA]
+    beforeEffector=dict(effector)
+
+    getattr(effector, func)(lFA, *args, **kargs)
+
+    return _changes(effector, beforeEffector), dict([(j, _changes(FA, b)) for j, FA, b in zip(idx, lFA, before)])
@@ -28,6 +28,39 @@ def readFile(fileName, mode="rU"):
     else:
         return open(fileName, mode)
 
+def readFastaHeaders(f, chunkSize=1 << 20):
+    """
+    Yield the header lines (without the leading '>') of the records of a FASTA file object f.
+    The file is scanned by chunks of chunkSize bytes and the sequences are skipped without being parsed.
+    """
+    data="\n"
+    while True:
+        chunk=f.read(chunkSize)
+        data=data+chunk
+
+        pos=0
+        while True:
+            i=data.find("\n>", pos)
+            if i < 0:
+                #Keep the last character, it may start the next header
+                data=data[-1:]
+                break
+
+            j=data.find("\n", i+2)
+            if j < 0:
+                if len(chunk)==0:
+                    yield data[i+2:].rstrip()
+                    data=""
+                else:
+                    data=data[i:]
+                break
+
+            yield data[i+2:j].rstrip()
+            pos=j
+
+        if len(chunk)==0:
+            break
+
 def createDir(dir):
     if not os.path.exists(dir):
         try:
@@ -21,6 +21,12 @@ class Logger:
             # if a PercentMessage class is currently in process, then withhold
             # info messages
             self.percentMessage = False
+            # counted warnings are printed one by one if True, else summarized
+            # by warningSummary
+            self.verboseWarnings = False
+            self.warnings = {}
+            # number of pending calls to withholdInfo
+            self.withheld = 0
 
 
     def timenow(self):
@@ -30,7 +36,7 @@ class Logger:
     ## Log a info message
     # @param msg information message to log
     def info(self, msg, singleline=False):
-        if self.loglevel==3 and not self.percentMessage:
+        if self.loglevel==3 and not self.percentMessage and self.withheld==0:
             if self.stdout_logging and singleline:
                 print "\r" + self.timenow() + "\033[32;1minfo:\033[0m " + msg,
                 sys.stdout.flush()
@@ -40,6 +46,16 @@ class Logger:
                 print self.timenow() + "INFO: "+msg
 
 
+    ## Withhold the info messages until the matching call to releaseInfo, calls can be nested
+    def withholdInfo(self):
+        self.withheld += 1
+
+
+    ## Stop withholding the info messages, see withholdInfo
+    def releaseInfo(self):
+        self.withheld = max(self.withheld - 1, 0)
+
+
     ## Log a warning message (bad, but not bad enough to stop the program)
     # @param error Error message to log
     # @param exception If true this method will print the last stacktrace as well
@@ -58,6 +74,37 @@ class Logger:
             raise RuntimeWarning, error
 
 
+    ## Count a warning of a category instead of printing it, see warningSummary.  The message is only built
+    # for the first samples warnings of the category.  Warnings are printed one by one in verbose mode.
+    # @param category Format string of the message, also used as the name of the category
+    # @param args Arguments of the format string
+    # @param samples Number of messages of the category kept as examples
+    def countWarning(self, category, args=(), samples=3):
+        if self.verboseWarnings or self.loglevel == 0:
+            self.handleWarning(category % args)
+            return
+
+        counted = self.warnings.get(category)
+        if counted is None:
+            counted = self.warnings[category] = [0, []]
+        counted[0] += 1
+        if len(counted[1]) < samples:
+            counted[1].append(category % args)
+
+
+    ## Log the number of counted warnings of each category with their examples, then reset the counters
+    def warningSummary(self):
+        warnings, self.warnings = self.warnings, {}
+        if not warnings or self.loglevel < 2:
+            return
+
+        self.handleWarning("%d warnings in %d categories" % (sum([w[0] for w in warnings.values()]), len(warnings)))
+        for category, (count, samples) in sorted(warnings.items(), key=lambda item: -item[1][0]):
+            self.handleWarning("%10d  %s" % (count, category.replace("%s", "...").strip()))
+            for msg in samples:
+                self.handleWarning("%10s  e.g. %s" % ("", msg.strip()))
+
+
     ## Log a message concerning a fatal error that will cause this program to terminate.  The function then
     # terminates the program.
     # @param fatal The message containing a description of the fatal conditions.
@@ -85,7 +132,7 @@ class Logger:
 ## Class to handle percent logging to terminal.  Note that once you call update for the first time,
 # Logger info messages will be suppressed until you call finished.
 # p = LogProgress(totalsize)
-# p.update() # run many times
+# p.update() # run many times, or p.update(step) to advance by step
 # p.finished()
 class LogProgress:
     def __init__(self, size):
@@ -96,15 +143,15 @@ class LogProgress:
         self.index = 0
 
 
-    def update(self):
+    def update(self, step=1):
         if self.start is None:
             self.start = time.time()
-        self.current += 1
-        self.index += 1
+        self.current += step
+        self.index += step
 
-        if self.size > 100000 and self.index != 10000:
+        if self.size > 100000 and self.index < 10000:
             return
-        if self.index == 10000:
+        if self.index >= 10000:
             self.index = 0
 
         ratio = float(self.current) / self.size
@@ -1,5 +1,17 @@
 #!/usr/bin/env python
+import sys, time
+
+#The analysis core only needs NumPy: importing it must not load matplotlib
+IMPORT_BUDGET=1.0
+start=time.time()
+import AIGO.Analyse
+importTime=time.time()-start
+assert not sys.modules.has_key("matplotlib"), "AIGO.Analyse imports matplotlib"
+
 from AIGO import logger
+logger.info("Import of AIGO.Analyse: %.2fs" % importTime)
+if importTime > IMPORT_BUDGET:
+    logger.handleWarning("Import of AIGO.Analyse took more than %.1fs" % IMPORT_BUDGET)
 
 from AIGO.ReferenceSet import RefSet
 from AIGO.FunctionalAnnotation import FuncAnnot
@@ -28,3 +40,54 @@ reportFA = ReportFA(outDir=None, name="platypusProject", organism="platypus")
 reportFA.printStatistics([FA] ,batchList)
 
     
+
+#Statistics after inter, removeGP and add must match those of a mapping rebuilt from GPtoGO
+other = FuncAnnot("platypusShifted", refSet, G, organism="platypus")
+for a in G.aspect:
+    genes=sorted(FA.GPtoGO[a])
+    other.GPtoGO[a]=dict(zip(genes, [set(FA.GPtoGO[a][gp]) for gp in genes[1:]+genes[:1]]))
+    other.GOtoGP[a]=dict()
+    for gp in other.GPtoGO[a]:
+        for go in other.GPtoGO[a][gp]:
+            other.GOtoGP[a].setdefault(go, set()).add(gp)
+other.loaded()
+
+updated = FuncAnnot("platypusUpdated", refSet, G, organism="platypus")
+updated.read("platypus.gaf", "GAF")
+checkList=["obsolete", "unconnected", "coverage", "richness", "numberAnnot", "redundancy", "specificity"]
+batchExecute(checkList, analyseFA, [updated])
+updated.inter(other)
+removedGP=sorted(updated['GA'])[::10]
+updated.removeGP(removedGP)
+
+#The removed gene products come back, with an empty set only in the first aspect
+extra = FuncAnnot("platypusExtra", refSet, G, organism="platypus")
+for a in G.aspect:
+    extra.GPtoGO[a]=dict([(gp, set()) for gp in removedGP[::2]])
+    if not a==G.aspect[0]:
+        extra.GPtoGO[a].update([(gp, set(FA.GPtoGO[a][gp])) for gp in removedGP[1::2] if FA.GPtoGO[a].has_key(gp)])
+updated.add(extra)
+
+rebuilt = FuncAnnot("platypusRebuilt", refSet, G, organism="platypus")
+for a in G.aspect:
+    rebuilt.GPtoGO[a]=dict([(gp, set(GO)) for gp, GO in updated.GPtoGO[a].items()])
+    rebuilt.GOtoGP[a]=dict()
+    for gp in rebuilt.GPtoGO[a]:
+        for go in rebuilt.GPtoGO[a][gp]:
+            rebuilt.GOtoGP[a].setdefault(go, set()).add(gp)
+rebuilt.loaded()
+batchExecute(checkList, analyseFA, [rebuilt])
+
+def sameValues(value, expected):
+    #Lists are compared as multisets, nan (empty sets) included
+    if isinstance(value, list):
+        numbers=lambda l: sorted([v for v in l if v==v])
+        return len(value)==len(expected) and numbers(value)==numbers(expected)
+    if value!=value:
+        return expected!=expected
+    return abs(value-expected) < 1e-9
+
+for statistics in checkList+["obsTerm"]:
+    for a in updated[statistics]:
+        assert sameValues(updated[statistics][a], rebuilt[statistics][a]), "%s of %s differs after inter, removeGP and add" % (statistics, a)
+logger.info("Statistics after inter, removeGP and add match a rebuilt mapping")